@@ -1,4 +1,37 @@
+import click
+
 import analysis
+import stream
+
+
+@click.command()
+@click.option('--dataset', type=str, default='data/sample.csv',
+              help='Dataset to analyze')
+@click.option('--stream', 'streaming', is_flag=True,
+              help='Read the dataset in chunks, use with the full dataset')
+@click.option('--chunk-size', type=int, default=100_000,
+              help='Number of rows read at once when streaming')
+@click.option('--cache/--no-cache', default=True,
+              help='Store the preprocessed dataset in data/cache')
+@click.option('--workers', type=int, default=None,
+              help='Number of processes rendering plots, all CPUs by default')
+@click.option('--boxplot-stats', is_flag=True,
+              help='Draw boxplots from per-group statistics, always used '
+              'when streaming')
+@click.option('--density', is_flag=True,
+              help='Draw scatter plots as 2D histograms, always used when '
+              'streaming')
+@click.option('--overlay', type=int, default=0,
+              help='Number of sampled points drawn over 2D histograms')
+def main(dataset: str, streaming: bool, chunk_size: int, cache: bool,
+         workers: int, boxplot_stats: bool, density: bool,
+         overlay: int) -> None:
+    if streaming:
+        stream.process(dataset, chunk_size, workers, overlay)
+    else:
+        analysis.process(dataset, cache, workers, boxplot_stats, density,
+                         overlay)
+
 
 if __name__ == '__main__':
-    analysis.process()
+    main()
@@ -1,3 +1,5 @@
+import functools
+import re
 from dataclasses import dataclass
 
 
@@ -8,3 +10,105 @@ class Aircraft:
 
     def __str__(self):
         return f'{self.manufacturer} {self.model}'
+
+
+# Rules are tried in order, a rule applies if any of its patterns is found in
+# the lowercased equipment description. Each rule is (manufacturer, patterns,
+# model rules, default model), model rules are (model, patterns) tried in
+# order, an aircraft without a matching model nor a default is unexpected
+rules = [
+    ('Airbus', ['airbus'], [
+        ('A220', ['a220']),
+        ('A300', ['a300']),
+        ('A310', ['a310']),
+        ('A330', ['a330']),
+        ('A340', ['a340']),
+        ('A350', ['a350']),
+        ('A380', ['a380']),
+        ('A320', ['a318', 'a319', 'a32']),
+    ], None),
+    ('Boeing', ['boeing'], [
+        ('707', ['707']),
+        ('717', ['717']),
+        ('727', ['727']),
+        ('737', ['737']),
+        ('747', ['747']),
+        ('757', ['757']),
+        ('767', ['767']),
+        ('777', ['777']),
+        ('787', ['787']),
+    ], None),
+    ('Embraer', ['embraer'], [
+        ('175', ['175', '170']),
+        ('190', ['190', '195']),
+        ('145', ['145']),
+    ], None),
+    ('CRJ', ['canadair', 'canadian'], [('700', ['700'])], '900'),
+    # Unfortunately, we do not know which Cessna we're flying, thus we can
+    # only choose to ignore it
+    (None, ['metro', 'bus', 'varies', '^nan$', '^cessna$'], [], None),
+    ('Tecnam', ['tecnam'], [], 'p2012'),
+    ('Pilatus', ['pilatus'], [], 'PC-12'),
+    ('Dehavilland', ['dehavilland'], [], 'DHC-8'),
+    ('Fairchild', ['fairchild'], [], 'Dornier 238'),
+    ('ATR', ['atr'], [('42', ['42'])], '72'),
+]
+
+wide_bodies = {
+    Aircraft('Airbus', 'A330'),
+    Aircraft('Airbus', 'A340'),
+    Aircraft('Airbus', 'A350'),
+    Aircraft('Boeing', '767'),
+    Aircraft('Boeing', '777'),
+    Aircraft('Boeing', '787'),
+}
+
+
+def compile_rules(patterns: list[list[str]]):
+    # Alternatives are tried in order at the start of the string, each one
+    # looks ahead for its patterns, thus lastindex is the first rule found
+    # anywhere in the string rather than the leftmost match
+    return re.compile('|'.join(f'(?=.*?({"|".join(p)}))' for p in patterns))
+
+
+manufacturer_rules = compile_rules([rule[1] for rule in rules])
+model_rules = [compile_rules([model[1] for model in rule[2]]) if rule[2]
+               else None for rule in rules]
+
+
+@functools.lru_cache(maxsize=None)
+def parse_aircraft(equipment: str):
+    equipment = equipment.lower()
+
+    if not equipment:
+        return None
+
+    match = manufacturer_rules.match(equipment)
+    if not match:
+        raise RuntimeError(f'Unexpected aircraft {equipment}')
+
+    index = match.lastindex - 1
+    manufacturer, _, models, model = rules[index]
+
+    if not manufacturer:
+        return None
+
+    if models and (match := model_rules[index].match(equipment)):
+        model = models[match.lastindex - 1][0]
+
+    if not model:
+        raise RuntimeError(f'Unexpected aircraft{equipment}')
+
+    return Aircraft(manufacturer, model)
+
+
+def body_type(equipment: str) -> str:
+    aircraft = parse_aircraft(equipment)
+    if not aircraft or aircraft.manufacturer not in ('Airbus', 'Boeing'):
+        return 'ignore'
+    return 'widebody' if aircraft in wide_bodies else 'narrowbody'
+
+
+def map_unique(column, fn):
+    # Applies fn once per distinct value of a (categorical) column
+    return column.map({value: fn(value) for value in column.unique()})
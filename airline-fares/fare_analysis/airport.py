@@ -1,5 +1,11 @@
+import csv
+import os
 from dataclasses import dataclass
 
+import numpy
+
+from cache import file_hash
+
 
 @dataclass(eq=True, frozen=True)
 class Airport:
@@ -7,3 +13,118 @@ class Airport:
     iata: str
     name: str
     country: str
+
+
+def parse_airports(path: str) -> dict[str, numpy.ndarray]:
+    # Airports as columns, codes is the sorted array of IATA and ICAO codes
+    # and rows the index of the airport of each code, if two airports share
+    # a code, the later one is kept
+    rows = dict()
+    icao, iata, names, country = [], [], [], []
+
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+        next(reader)
+        for row in reader:
+            if not row[1] or row[1] in ('closed', 'heliport') or \
+               len(row[0]) != 4 or not row[9]:
+                continue
+
+            rows[row[9]] = rows[row[0]] = len(icao)
+            icao.append(row[0])
+            iata.append(row[9])
+            names.append(row[2].encode('utf-8'))
+            country.append(row[5])
+
+    codes = sorted(rows)
+
+    return {
+        'codes': numpy.array(codes, dtype=str),
+        'rows': numpy.array([rows[code] for code in codes], dtype=numpy.int32),
+        'icao': numpy.array(icao, dtype=str),
+        'iata': numpy.array(iata, dtype=str),
+        'country': numpy.array(country, dtype=str),
+        # Names are concatenated, name i is names[offsets[i]:offsets[i + 1]]
+        'names': numpy.frombuffer(b''.join(names), dtype=numpy.uint8),
+        'offsets': numpy.cumsum([0] + [len(name) for name in names]),
+    }
+
+
+def load_table(path: str) -> dict[str, numpy.ndarray]:
+    directory, file = os.path.split(path)
+    cache = os.path.join(directory, 'cache',
+                         f'{os.path.splitext(file)[0]}.npz')
+    digest = file_hash(path)
+
+    if os.path.exists(cache):
+        with numpy.load(cache) as npz:
+            if str(npz['hash']) == digest:
+                return {key: npz[key] for key in npz.files if key != 'hash'}
+
+    table = parse_airports(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    numpy.savez(cache, hash=digest, **table)
+
+    return table
+
+
+class AirportRegistry:
+    # Airports indexed by their IATA and ICAO codes, the table is parsed once
+    # and cached next to the CSV file, it is loaded on the first lookup
+    __slots__ = ('path', 'table')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.table = None
+
+    def load(self):
+        if self.table is None:
+            self.table = load_table(self.path)
+        return self.table
+
+    def find(self, codes) -> numpy.ndarray:
+        # Rows of the airports of codes, -1 for unknown codes
+        table = self.load()
+        codes = numpy.asarray(codes, dtype=str)
+        if not len(table['codes']):
+            return numpy.full(len(codes), -1)
+
+        found = numpy.searchsorted(table['codes'], codes)
+        found = numpy.minimum(found, len(table['codes']) - 1)
+        known = table['codes'][found] == codes
+
+        return numpy.where(known, table['rows'][found], -1)
+
+    def name(self, row: int) -> str:
+        table = self.load()
+        begin, end = table['offsets'][row], table['offsets'][row + 1]
+        return table['names'][begin:end].tobytes().decode('utf-8')
+
+    def names(self, codes) -> list[str]:
+        rows = self.find(codes)
+        if (rows < 0).any():
+            unknown = numpy.asarray(codes, dtype=str)[rows < 0]
+            raise KeyError(f'Unknown airports: {", ".join(unknown)}')
+        # Each airport is decoded once, however many codes refer to it
+        unique, inverse = numpy.unique(rows, return_inverse=True)
+        names = [self.name(row) for row in unique]
+        return [names[i] for i in inverse.ravel()]
+
+    def __contains__(self, code: str) -> bool:
+        return self.find([code])[0] >= 0
+
+    def __getitem__(self, code: str) -> Airport:
+        row = self.find([code])[0]
+        if row < 0:
+            raise KeyError(code)
+
+        table = self.load()
+        return Airport(
+                icao=str(table['icao'][row]),
+                iata=str(table['iata'][row]),
+                name=self.name(row),
+                country=str(table['country'][row]),
+                )
+
+    def __len__(self) -> int:
+        return len(self.load()['icao'])
@@ -1,88 +1,45 @@
-import csv
-from datetime import datetime
-
+import numpy
 import pandas
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from airport import Airport
-from flight import Flight
-from aircraft import Aircraft
-
-
-def parse_date(date: str):
-    format = '%Y-%m-%d'
-    return datetime.strptime(date, format)
-
-
-def load_df(path: str):
-    return pandas.read_csv(path, sep=',')
 
+from airport import AirportRegistry
+from aircraft import body_type, map_unique, parse_aircraft
+from cohort import CohortIndex
+from cache import FrameCache
+from report import TrafficReport
+from plots import PlotJob, densify, render_all, summarize
 
-def load_airports(path: str) -> dict[str, Airport]:
 
-    airports = dict()
+def parse_date(dates):
+    return pandas.to_datetime(dates, format='%Y-%m-%d')
 
-    with open(path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',', quotechar='"')
-        next(reader)
-        for row in reader:
-            if not row[1] or row[1] in ('closed', 'heliport') or \
-               len(row[0]) != 4 or not row[9]:
-                continue
 
-            icao = row[0]
-            iata = row[9]
-            name = row[2]
-            country = row[5]
+def bucketize(values, edges, name: str):
+    # Index i of the bucket [edges[i], edges[i + 1]) of each value, values
+    # outside of all buckets are reported together
+    codes = numpy.searchsorted(edges, values, side='right') - 1
+    outside = (codes < 0) | (codes >= len(edges) - 1)
 
-            airport = Airport(
-                    icao=icao,
-                    iata=iata,
-                    name=name,
-                    country=country,
-                    )
+    if outside.any():
+        invalid = numpy.unique(numpy.asarray(values)[outside])
+        raise RuntimeError(f'{outside.sum()} values of {name} outside of '
+                           f'bucket range [{edges[0]}, {edges[-1]}): '
+                           f'{", ".join(map(str, invalid[:10]))}'
+                           f'{", ..." if len(invalid) > 10 else ""}')
 
-            airports[iata] = airport
-            airports[icao] = airport
+    return pandas.Series(codes, index=values.index, name=name)
 
-    return airports
-
-
-def airlines_flying_together(df) -> dict[str, set[str]]:
-    together = dict()
-
-    for flight in df['segmentsAirlineCode']:
-        airlines = flight.split('||')
-
-        for airline in airlines:
-            shared_flights = together.get(airline, set())
-            for a2 in airlines:
-                if a2 == airline:
-                    continue
-                shared_flights.add(a2)
-
-            together[airline] = shared_flights
-
-    print('|airline|shares flights with|')
-    print('|-------|-------------------|')
-    for airline, other in together.items():
-        print(f'|{airline}|{", ".join(other)}|')
 
+def load_df(path: str):
+    return pandas.read_csv(path, sep=',')
 
-def appearances_in_multisegment(df) -> dict[str, set[str]]:
-    appearances = dict()
 
-    for flight in df['segmentsAirlineCode']:
-        airlines = flight.split('||')
+def iter_df(path: str, chunk_size: int, columns=None, dtypes=None):
+    return pandas.read_csv(path, sep=',', chunksize=chunk_size,
+                           usecols=columns, dtype=dtypes)
 
-        for airline in airlines:
-            appearances[airline] = appearances.get(airline, 0) + 1
 
-    print('|airline|appearances in multisegment trips|')
-    print('|-------|---------------------------------|')
-    for airline, count in appearances.items():
-        print(f'|{airline}|{count}|')
+def load_airports(path: str) -> AirportRegistry:
+    return AirportRegistry(path)
 
 
 def extract_airlines(df):
@@ -102,118 +59,102 @@ def extract_airlines(df):
     return airlines
 
 
+segment_columns = {
+    'airline': 'segmentsAirlineCode',
+    'cabin': 'segmentsCabinCode',
+    'departure': 'segmentsDepartureAirportCode',
+    'arrival': 'segmentsArrivalAirportCode',
+    'equipment': 'segmentsEquipmentDescription',
+    'epoch': 'segmentsDepartureTimeEpochSeconds',
+}
+
+
+def explode_segments(df):
+    # Long-form table with one row per flight segment, segments of itinerary
+    # i (index of df) are the rows with itinerary == i ordered by position
+    columns = dict()
+
+    for name, column in segment_columns.items():
+        split = df[column].astype(str).str.split('||', regex=False).explode()
+        position = split.groupby(level=0).cumcount()
+        split.index = pandas.MultiIndex.from_arrays(
+                [split.index, position], names=['itinerary', 'position'])
+        columns[name] = split
+
+    segments = pandas.concat(columns, axis=1).reset_index()
+    segments['equipment'] = segments['equipment'].fillna('nan')
+    segments['epoch'] = pandas.to_numeric(segments['epoch'], errors='coerce')
+
+    return segments
+
+
 def preprocess_df(df):
     df.drop(columns=['legId',
                      'segmentsAirlineName',
                      'segmentsDepartureTimeRaw',
                      'segmentsArrivalTimeRaw',
-                     ])
-    df['searchDate'] = df['searchDate'].apply(parse_date)
-    df['flightDate'] = df['flightDate'].apply(parse_date)
+                     ], errors='ignore')
+    df['searchDate'] = parse_date(df['searchDate'])
+    df['flightDate'] = parse_date(df['flightDate'])
     df['segmentsEquipmentDescription'] = \
         df['segmentsEquipmentDescription'].astype(str)
 
-    dateDiff = []
-    for search, flight in zip(df['searchDate'], df['flightDate']):
-        dt = flight - search
-        dateDiff.append(dt.days)
-    df['dateDiff'] = dateDiff
+    df['dateDiff'] = (df['flightDate'] - df['searchDate']).dt.days
 
     assign_buckets(df)
 
-
-def most_frequented_airports(df, limit, airport_data):
-    destination = df['destinationAirport']
-    departures = df['segmentsDepartureAirportCode']
-
-    airports = dict()
-
-    for dest, dep in zip(destination, departures):
-        visited = dep.split('||')
-        visited.append(dest)
-        for v in visited:
-            airports[v] = airports.get(v, 0) + 1
-
-    most_freq = sorted(airports.items(),
-                       key=lambda x: x[1],
-                       reverse=True)[:limit]
-
-    print('|Airport|Airport name|Number of visits|')
-    print('|-------|------------|----------------|')
-    for airport, visits in most_freq:
-        print(f'|{airport}|{airport_data[airport].name}|{visits}|')
-
-    return most_freq
+    return explode_segments(df)
 
 
-def most_desired_destination(df, limit, airport_data):
-    destination = df['destinationAirport']
-    frequency = dict()
+categorical_columns = ['startingAirport', 'destinationAirport']
+categorical_segment_columns = ['airline', 'cabin', 'departure', 'arrival',
+                               'equipment']
 
-    for ap in destination:
-        frequency[ap] = frequency.get(ap, 0) + 1
+# Columns of the preprocessed frame read by the analyses and the report
+analysis_columns = ['flightDate', 'destinationAirport', 'isNonStop',
+                    'totalFare', 'seatsRemaining', 'totalTravelDistance',
+                    'segmentsDepartureAirportCode',
+                    'segmentsEquipmentDescription', 'dateDiff',
+                    'dateDiffBucket']
 
-    most_freq = sorted(frequency.items(),
-                       key=lambda x: x[1],
-                       reverse=True)[:limit]
 
-    print('|Airport|Airport name|Number of trips|')
-    print('|-------|------------|----------------|')
-    for airport, trips in most_freq:
-        print(f'|{airport}|{airport_data[airport].name}|{trips}|')
+def load_preprocessed(path: str, columns=None, cache=True):
+    # Preprocessed dataset and its segments, stored in a columnar cache on
+    # the first run, later runs only read the columns they need
+    store = FrameCache(path)
 
-    return most_freq
+    if cache and store.fresh():
+        return store.read('df', columns), store.read('segments')
 
+    df = load_df(path)
+    segments = preprocess_df(df)
 
-def most_desired_route(df, limit, airport_data):
-    departure = df['segmentsDepartureAirportCode']
-    destination = df['destinationAirport']
+    for column in categorical_columns:
+        df[column] = df[column].astype('category')
+    for column in categorical_segment_columns:
+        segments[column] = segments[column].astype('category')
 
-    frequency = dict()
+    if cache:
+        store.write(df=df, segments=segments)
 
-    for key in zip(departure, destination):
-        frequency[key] = frequency.get(key, 0) + 1
+    return (df[columns] if columns else df), segments
 
-    most_freq = sorted(frequency.items(),
-                       key=lambda x: x[1],
-                       reverse=True)[:limit]
 
-    print('|Route|Number of trips|')
-    print('|-----|----------------|')
-    for route, trips in most_freq:
-        dep, dest = route
-        print(f'|{dep}-{dest}|{trips}|')
+def priced(df):
+    return df['dateDiff'].notna() & df['totalFare'].notna()
 
-    return most_freq
 
+def priced_non_stop(df):
+    return df['isNonStop'] & df['totalTravelDistance'].notna() \
+        & df['totalFare'].notna()
 
-def filter_by_airline(series, airlines):
-    def filter_one(al):
-        return all(map(lambda x: x in airlines, al.split('||')))
-    return series.apply(filter_one)
 
+def correlation_price_date(cohorts, travel_class, airlines=None):
+    df = cohorts.df
+    mask = cohorts.mask(travel_class, airlines) \
+        & cohorts.column('priced', priced)
 
-def filter_by_class(series, travel_class):
-    def filter_one(record):
-        return all(map(lambda x: x == travel_class, record.split('||')))
-    return series.apply(filter_one)
-
-
-def correlation_price_date(df, travel_class, airlines=None):
-
-    filtered = df.copy()
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['dateDiff'].notna()]
-    filtered = filtered[filtered['totalFare'].notna()]
-
-    filtered['dateDiff'] = 365 - filtered['dateDiff']
-
-    if airlines:
-        filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                              airlines)]
-
-    corr = filtered['totalFare'].corr(filtered['dateDiff'])
+    corr = df['totalFare'][mask].corr(365 - df['dateDiff'][mask])
 
     res_str = f'Correlation for travel class {travel_class}'
     if airlines:
@@ -228,329 +169,176 @@ def scraped_more_than_day_before(df):
     print(f'#deals scraped more than one day before day of flight: {count}')
 
 
-date_diff_buckets = [
-            range(2), range(2, 4), range(4, 8), range(8, 15), range(15, 22),
-            range(22, 31), range(31, 62), range(62, 367),
-            ]
+date_diff_edges = [0, 2, 4, 8, 15, 22, 31, 62, 367]
 
 
 def assign_buckets(df):
-    def assign_one(diff):
-        for i, b in enumerate(date_diff_buckets):
-            if diff in b:
-                return i
-        raise RuntimeError('Delta outside of bucket range')
+    df['dateDiffBucket'] = bucketize(df['dateDiff'], date_diff_edges,
+                                     'dateDiff')
 
-    df['dateDiffBucket'] = df['dateDiff'].apply(assign_one)
 
+def ticket_price_by_bucket(cohorts, travel_class, airlines):
+    df = cohorts.df
+    mask = cohorts.mask(travel_class, airlines) \
+        & cohorts.column('priced', priced)
 
-def ticket_price_by_bucket(df, travel_class, airlines):
+    return PlotJob(
+            kind='boxplot',
+            file=f'plots/buckets_{travel_class}_{"_".join(airlines)}.png',
+            x=df['dateDiffBucket'][mask],
+            y=df['totalFare'][mask],
+            title=f'{travel_class} ({", ".join(airlines)})',
+            )
 
-    filtered = df.copy()
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['dateDiff'].notna()]
-    filtered = filtered[filtered['totalFare'].notna()]
 
-    if airlines:
-        filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                              airlines)]
+def day_of_week(df):
+    return df['flightDate'].dt.weekday.rename('dow')
 
-    plt.figure()
-    sns.boxplot(data=filtered, y='totalFare', x='dateDiffBucket') \
-        .set(title=f'{travel_class} ({", ".join(airlines)})')
-    plt.savefig(f'plots/buckets_{travel_class}_{"_".join(airlines)}.png')
 
+def ticket_price_by_dow(cohorts, travel_class, airlines):
+    df = cohorts.df
+    mask = cohorts.mask(travel_class, airlines) \
+        & cohorts.column('priced', priced)
+    dow = cohorts.column('dow', day_of_week)
 
-def ticket_price_by_dow(df, travel_class, airlines):
-    filtered = df.copy()
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['dateDiff'].notna()]
-    filtered = filtered[filtered['totalFare'].notna()]
+    return PlotJob(
+            kind='boxplot',
+            file=f'plots/dow_{travel_class}_{"_".join(airlines)}.png',
+            x=dow[mask],
+            y=df['totalFare'][mask],
+            title=f'{travel_class} ({", ".join(airlines)})',
+            )
 
-    if airlines:
-        filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                              airlines)]
-
-    filtered['dow'] = filtered['flightDate'].apply(lambda x: x.weekday())
 
-    plt.figure()
-    sns.boxplot(data=filtered, y='totalFare', x='dow') \
-        .set(title=f'{travel_class} ({", ".join(airlines)})')
-    plt.savefig(f'plots/dow_{travel_class}_{"_".join(airlines)}.png')
+empty_seats_edges = [0, 2, 5, 10, 20, 1000]
 
 
-empty_seats_buckets = [
-        range(2), range(2, 5), range(5, 10), range(10, 20), range(20, 1000),
-        ]
+def empty_seats_bucket(df):
+    return bucketize(df['seatsRemaining'], empty_seats_edges,
+                     'seatsRemaining').rename('emptySeatsBucket')
 
 
-def ticket_price_by_empty_seats(df, travel_class, airlines):
-    filtered = df.copy()
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['dateDiff'].notna()]
-    filtered = filtered[filtered['totalFare'].notna()]
-
-    if airlines:
-        filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                              airlines)]
+def ticket_price_by_empty_seats(cohorts, travel_class, airlines):
+    df = cohorts.df
+    mask = cohorts.mask(travel_class, airlines) \
+        & cohorts.column('priced', priced)
+    bucket = cohorts.column('emptySeatsBucket', empty_seats_bucket)
 
-    def assign_one(seats):
-        for i, b in enumerate(empty_seats_buckets):
-            if seats in b:
-                return i
-        raise RuntimeError('Num of empty seats outside of bucket range')
-
-    filtered['emptySeatsBucket'] = filtered['seatsRemaining'].apply(assign_one)
-
-    plt.figure()
-    sns.boxplot(data=filtered, y='totalFare', x='emptySeatsBucket') \
-        .set(title=f'{travel_class} ({", ".join(airlines)})')
     file = f'plots/seatsRemaining_{travel_class}_{"_".join(airlines)}.png'
-    plt.savefig(file)
-
-
-def offers_by_date_diff(df, travel_class):
-    filtered = df.copy()
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['dateDiff'].notna()]
-    filtered = filtered[filtered['totalFare'].notna()]
-
-    def carriers_to_type(airlines):
-        split = airlines.split('||')
-
-        tc = {'AA', 'DL', 'UA'}
-        lc = {'B6', 'NK', 'SY', 'F9'}
-        trad = all(map(lambda x: x in tc, split))
-        lcc = all(map(lambda x: x in lc, split))
-
-        if trad:
-            return 'traditional'
-        elif lcc:
-            return 'lcc'
-        else:
-            return 'ignore'
-
-    filtered['carrierType'] = filtered['segmentsAirlineCode'] \
-        .apply(carriers_to_type)
-
-    filtered = filtered[filtered['carrierType'] != 'ignore']
-
-    plt.figure()
-    sns.boxplot(data=filtered, y='dateDiff', x='carrierType') \
-        .set(title=f'{travel_class}')
-    file = f'plots/offers_by_date_diff_{travel_class}.png'
-    plt.savefig(file)
-
-
-def parse_aircraft(equipment: str):
-    equipment = equipment.lower()
-
-    manufacturer = ''
-    model = ''
-
-    if not equipment:
-        return None
-
-    if 'airbus' in equipment:
-        manufacturer = 'Airbus'
-        if 'a220' in equipment:
-            model = 'A220'
-        elif 'a300' in equipment:
-            model = 'A300'
-        elif 'a310' in equipment:
-            model = 'A310'
-        elif 'a330' in equipment:
-            model = 'A330'
-        elif 'a340' in equipment:
-            model = 'A340'
-        elif 'a350' in equipment:
-            model = 'A350'
-        elif 'a380' in equipment:
-            model = 'A380'
-        elif 'a318' in equipment or 'a319' in equipment or 'a32' in equipment:
-            model = 'A320'
-        else:
-            raise RuntimeError(f'Unexpected aircraft{equipment}')
-    elif 'boeing' in equipment:
-        manufacturer = 'Boeing'
-        if '707' in equipment:
-            model = '707'
-        elif '717' in equipment:
-            model = '717'
-        elif '727' in equipment:
-            model = '727'
-        elif '737' in equipment:
-            model = '737'
-        elif '747' in equipment:
-            model = '747'
-        elif '757' in equipment:
-            model = '757'
-        elif '767' in equipment:
-            model = '767'
-        elif '777' in equipment:
-            model = '777'
-        elif '787' in equipment:
-            model = '787'
-        else:
-            raise RuntimeError(f'Unexpected aircraft{equipment}')
-    elif 'embraer' in equipment:
-        manufacturer = 'Embraer'
-        if '175' in equipment or '170' in equipment:
-            model = '175'
-        elif '190' in equipment or '195' in equipment:
-            model = '190'
-        elif '145' in equipment:
-            model = '145'
-        else:
-            raise RuntimeError(f'Unexpected aircraft{equipment}')
-    elif 'canadair' in equipment or 'canadian' in equipment:
-        manufacturer = 'CRJ'
-        model = '900'
-        if '700' in equipment:
-            model = '700'
-    # Unfortunately, we do not know which Cessna we're flying, thus we can only
-    # choose to ignore it
-    elif 'metro' in equipment or 'bus' in equipment or 'varies' in equipment \
-            or equipment == 'nan' or equipment == 'cessna':
-        return None
-    elif 'tecnam' in equipment:
-        manufacturer = 'Tecnam'
-        model = 'p2012'
-    elif 'pilatus' in equipment:
-        manufacturer = 'Pilatus'
-        model = 'PC-12'
-    elif 'dehavilland' in equipment:
-        manufacturer = 'Dehavilland'
-        model = 'DHC-8'
-    elif 'fairchild' in equipment:
-        manufacturer = 'Fairchild'
-        model = 'Dornier 238'
-    elif 'atr' in equipment:
-        manufacturer = 'ATR'
-        model = '42' if '42' in equipment else '72'
-    else:
-        raise RuntimeError(f'Unexpected aircraft {equipment}')
-
-    return Aircraft(manufacturer, model)
-
-
-def extract_flights(df):
-    flights = set()
-
-    for _, row in df.iterrows():
-
-        times = row['segmentsDepartureTimeEpochSeconds'].split('||')
-        airports = [row['startingAirport']] + \
-            row['segmentsArrivalAirportCode'].split('||')
-        airlines = row['segmentsAirlineCode'].split('||')
-        equipment = row['segmentsEquipmentDescription'].split('||')
-
-        for i in range(len(airports) - 1):
-            f = Flight(
-                    time=times[i],
-                    origin=airports[i],
-                    destination=airports[i+1],
-                    airline=airlines[i],
-                    aircraft=parse_aircraft(equipment[i]),
-                    )
-            if f.aircraft:
-                flights.add(f)
-
-    return flights
-
-
-def aircraft_stats(flights: list[Flight]):
-
-    manufacturers = dict()
-    models = dict()
-
-    for flight in flights:
-        m = flight.aircraft.manufacturer
-        model = str(flight.aircraft)
-        manufacturers[m] = manufacturers.get(m, 0) + 1
-        models[model] = models.get(model, 0) + 1
-
+    return PlotJob(
+            kind='boxplot',
+            file=file,
+            x=bucket[mask],
+            y=df['totalFare'][mask],
+            title=f'{travel_class} ({", ".join(airlines)})',
+            )
+
+
+def carrier_types(cohorts):
+    def compute(df):
+        carriers = pandas.Series('ignore', index=df.index, name='carrierType')
+        carriers[cohorts.airline_mask(['AA', 'DL', 'UA'])] = 'traditional'
+        carriers[cohorts.airline_mask(['B6', 'NK', 'SY', 'F9'])] = 'lcc'
+        return carriers
+
+    return cohorts.column('carrierType', compute)
+
+
+def offers_by_date_diff(cohorts, travel_class):
+    df = cohorts.df
+
+    carriers = carrier_types(cohorts)
+    mask = cohorts.mask(travel_class) & cohorts.column('priced', priced) \
+        & (carriers != 'ignore')
+
+    return PlotJob(
+            kind='boxplot',
+            file=f'plots/offers_by_date_diff_{travel_class}.png',
+            x=carriers[mask],
+            y=df['dateDiff'][mask],
+            title=f'{travel_class}',
+            )
+
+
+def extract_flights(segments):
+    # Distinct physical flights operated by a known aircraft, one row per
+    # (time, origin, destination, airline, aircraft)
+    aircraft = map_unique(segments['equipment'], parse_aircraft)
+    known = aircraft.notna()
+    aircraft = aircraft[known]
+
+    flights = pandas.DataFrame({
+        'time': segments['epoch'][known],
+        'origin': segments['departure'][known],
+        'destination': segments['arrival'][known],
+        'airline': segments['airline'][known],
+        'manufacturer': map_unique(aircraft, lambda a: a.manufacturer),
+        'aircraft': map_unique(aircraft, str),
+    })
+
+    flights = flights.drop_duplicates(ignore_index=True)
+    return flights.astype({column: 'category' for column in flights
+                           if column != 'time'})
+
+
+def aircraft_stats(flights):
     print('|manufacturer|count|')
     print('|------------|-----|')
-    for manufacturer, count in manufacturers.items():
+    for manufacturer, count in flights['manufacturer'].value_counts().items():
         print(f'|{manufacturer}|{count}|')
 
     print('|model|count|')
     print('|------------|-----|')
-    for model, count in models.items():
+    for model, count in flights['aircraft'].value_counts().items():
         print(f'|{model}|{count}|')
 
 
-def price_per_mile(df, travel_class, airlines):
-    filtered = df.copy()
-    filtered = filtered[filtered['isNonStop']]
-    filtered = filtered[filtered['totalTravelDistance'].notna()]
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        travel_class)]
-    filtered = filtered[filtered['totalFare'].notna()]
+def price_per_mile_column(df):
+    return (df['totalFare'] / df['totalTravelDistance']).rename('ppm')
 
-    if airlines:
-        filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                              airlines)]
 
-    filtered['ppm'] = filtered['totalFare'] / filtered['totalTravelDistance']
+def price_per_mile(cohorts, travel_class, airlines):
+    df = cohorts.df
+    mask = cohorts.mask(travel_class, airlines) \
+        & cohorts.column('pricedNonStop', priced_non_stop)
+
+    ppm = cohorts.column('ppm', price_per_mile_column)[mask]
+    distance = df['totalTravelDistance'][mask]
 
-    corr = filtered['ppm'].corr(filtered['totalTravelDistance'])
+    corr = ppm.corr(distance)
     print('Correlation between travel distance and price per mile',
           f'for class {travel_class} and airlines {airlines}: {corr}')
 
-    plt.figure()
-    plt.scatter(y=filtered['ppm'], x=filtered['totalTravelDistance'])
-    plt.title(f'{travel_class} ({", ".join(airlines)})')
+    file = f'plots/price_per_mile_{travel_class}_{"_".join(airlines)}.png'
+    return PlotJob(
+            kind='scatter',
+            file=file,
+            x=distance,
+            y=ppm,
+            title=f'{travel_class} ({", ".join(airlines)})',
+            xlabel='Travel Distance',
+            ylabel='Price Per Mile',
+            )
 
-    plt.xlabel('Travel Distance')
-    plt.ylabel('Price Per Mile')
 
-    file = f'plots/price_per_mile_{travel_class}_{"_".join(airlines)}.png'
-    plt.savefig(file)
-
-
-def wide_or_narrow(df):
-    filtered = df.copy()
-    filtered = filtered[filtered['isNonStop']]
-    filtered = filtered[filtered['totalTravelDistance'].notna()]
-    filtered = filtered[filter_by_class(filtered['segmentsCabinCode'],
-                                        'business')]
-    filtered = filtered[filtered['totalFare'].notna()]
-
-    filtered = filtered[filter_by_airline(filtered['segmentsAirlineCode'],
-                                          ['DL', 'AA', 'UA'])]
-
-    travel_distance_buckets = [
-            range(500), range(500, 1000), range(1000, 1500), range(1500, 2000),
-            range(2000, 2500), range(2500, 3000)]
-
-    def assign(seats):
-        for i, b in enumerate(travel_distance_buckets):
-            if seats in b:
-                return i
-        raise RuntimeError('Travel distance outside of bucket range')
-
-    filtered['distanceBucket'] = filtered['totalTravelDistance'].apply(assign)
-
-    def ac_type(aircraft):
-        aircraft = aircraft.lower()
-        if 'boeing' in aircraft:
-            if '777' in aircraft or '767' in aircraft or '787' in aircraft:
-                return 'widebody'
-            return 'narrowbody'
-        if 'airbus' in aircraft:
-            if '350' in aircraft or '330' in aircraft or '340' in aircraft:
-                return 'widebody'
-            return 'narrowbody'
-        return 'ignore'
-
-    filtered['body_type'] = filtered['segmentsEquipmentDescription'] \
-        .apply(ac_type)
+travel_distance_edges = [0, 500, 1000, 1500, 2000, 2500, 3000]
+
+
+def distance_bucket(df):
+    return bucketize(df['totalTravelDistance'], travel_distance_edges,
+                     'totalTravelDistance')
+
+
+def wide_or_narrow(cohorts):
+    df = cohorts.df
+    mask = cohorts.mask('business', ['DL', 'AA', 'UA']) \
+        & cohorts.column('pricedNonStop', priced_non_stop)
+
+    filtered = df[mask].copy()
+
+    filtered['distanceBucket'] = distance_bucket(filtered)
+    filtered['body_type'] = map_unique(
+            filtered['segmentsEquipmentDescription'], body_type)
 
     widebody = filtered[filtered['body_type'] == 'widebody']
     narrowbody = filtered[filtered['body_type'] == 'narrowbody']
@@ -558,69 +346,63 @@ def wide_or_narrow(df):
     print(widebody.shape)
     print(narrowbody.shape)
 
-    plt.figure()
-    sns.boxplot(data=widebody, y='totalFare', x='distanceBucket') \
-        .set(title='Widebody')
-    file = 'plots/widebody.png'
-    plt.savefig(file)
-
-    plt.figure()
-    sns.boxplot(data=narrowbody, y='totalFare', x='distanceBucket') \
-        .set(title='Narrowbody')
-    file = 'plots/narrowbody.png'
-    plt.savefig(file)
+    return [
+        PlotJob(kind='boxplot', file=f'plots/{kind}.png',
+                x=bodies['distanceBucket'], y=bodies['totalFare'],
+                title=kind.capitalize())
+        for kind, bodies in (('widebody', widebody),
+                             ('narrowbody', narrowbody))
+    ]
 
 
-def process():
+def process(path: str = 'data/sample.csv', cache: bool = True,
+            workers: int = None, boxplot_stats: bool = False,
+            density: bool = False, overlay: int = 0):
     print('Loading dataset...')
-    df = load_df('data/sample.csv')
+    df, segments = load_preprocessed(path, analysis_columns, cache)
 
     print('Loading airport data...')
     airports = load_airports('data/airport-codes_csv.csv')
 
-    print('Preprocessing dataset...')
     # airlines = extract_airlines(df)
 
-    preprocess_df(df)
+    for table in TrafficReport.of(df, segments).tables(10, airports):
+        print(table.markdown())
 
-    airlines_flying_together(df)
-    appearances_in_multisegment(df)
-    most_frequented_airports(df, 10, airports)
-    most_desired_destination(df, 10, airports)
-    most_desired_route(df, 10, airports)
+    cohorts = CohortIndex(df, segments)
 
-    correlation_price_date(df, 'coach')
-    correlation_price_date(df, 'business')
-    correlation_price_date(df, 'coach', ['DL', 'AA', 'UA'])
-    correlation_price_date(df, 'business', ['DL', 'AA', 'UA'])
-    correlation_price_date(df, 'coach', ['B6', 'NK', 'SY', 'F9'])
-    correlation_price_date(df, 'business', ['B6', 'NK', 'SY', 'F9'])
+    correlation_price_date(cohorts, 'coach')
+    correlation_price_date(cohorts, 'business')
+    correlation_price_date(cohorts, 'coach', ['DL', 'AA', 'UA'])
+    correlation_price_date(cohorts, 'business', ['DL', 'AA', 'UA'])
+    correlation_price_date(cohorts, 'coach', ['B6', 'NK', 'SY', 'F9'])
+    correlation_price_date(cohorts, 'business', ['B6', 'NK', 'SY', 'F9'])
     scraped_more_than_day_before(df)
 
-    ticket_price_by_bucket(df, 'coach', ['DL', 'AA', 'UA'])
-    ticket_price_by_bucket(df, 'business', ['DL', 'AA', 'UA'])
-    ticket_price_by_bucket(df, 'coach', ['B6', 'NK', 'SY', 'F9'])
-    ticket_price_by_bucket(df, 'business', ['B6', 'NK', 'SY', 'F9'])
+    jobs = []
 
-    ticket_price_by_dow(df, 'coach', ['DL', 'AA', 'UA'])
-    ticket_price_by_dow(df, 'business', ['DL', 'AA', 'UA'])
-    ticket_price_by_dow(df, 'coach', ['B6', 'NK', 'SY', 'F9'])
-    ticket_price_by_dow(df, 'business', ['B6', 'NK', 'SY', 'F9'])
+    for plot in (ticket_price_by_bucket, ticket_price_by_dow,
+                 ticket_price_by_empty_seats):
+        for airlines in (['DL', 'AA', 'UA'], ['B6', 'NK', 'SY', 'F9']):
+            for travel_class in ('coach', 'business'):
+                jobs.append(plot(cohorts, travel_class, airlines))
 
-    ticket_price_by_empty_seats(df, 'coach', ['DL', 'AA', 'UA'])
-    ticket_price_by_empty_seats(df, 'business', ['DL', 'AA', 'UA'])
-    ticket_price_by_empty_seats(df, 'coach', ['B6', 'NK', 'SY', 'F9'])
-    ticket_price_by_empty_seats(df, 'business', ['B6', 'NK', 'SY', 'F9'])
+    jobs.append(offers_by_date_diff(cohorts, 'coach'))
+    jobs.append(offers_by_date_diff(cohorts, 'business'))
 
-    offers_by_date_diff(df, 'coach')
-    offers_by_date_diff(df, 'business')
-
-    flights = extract_flights(df)
+    flights = extract_flights(segments)
     aircraft_stats(flights)
 
-    price_per_mile(df, 'coach', ['DL', 'AA', 'UA'])
-    price_per_mile(df, 'business', ['DL', 'AA', 'UA'])
-    price_per_mile(df, 'coach', ['B6', 'NK', 'SY', 'F9'])
-    price_per_mile(df, 'business', ['B6', 'NK', 'SY', 'F9'])
+    for airlines in (['DL', 'AA', 'UA'], ['B6', 'NK', 'SY', 'F9']):
+        for travel_class in ('coach', 'business'):
+            jobs.append(price_per_mile(cohorts, travel_class, airlines))
+
+    jobs += wide_or_narrow(cohorts)
+
+    if boxplot_stats:
+        jobs = [summarize(job) for job in jobs]
+    if density:
+        jobs = [densify(job, overlay=overlay) for job in jobs]
 
-    wide_or_narrow(df)
+    print('Rendering plots...')
+    render_all(jobs, workers)
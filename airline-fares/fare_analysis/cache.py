@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+import pyarrow
+import pyarrow.feather
+
+
+# Bump whenever preprocessing changes so stale caches are rebuilt
+version = 1
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FrameCache:
+    # Frames derived from a source file stored as Feather files next to it,
+    # the cache is valid as long as the source has the same size and either
+    # the same mtime or, if it has been touched, the same content hash
+
+    def __init__(self, source: str):
+        self.source = source
+        directory, file = os.path.split(source)
+        self.directory = os.path.join(directory, 'cache')
+        self.name = os.path.splitext(file)[0]
+
+    def path(self, frame: str) -> str:
+        return os.path.join(self.directory, f'{self.name}.{frame}.feather')
+
+    @property
+    def key_path(self) -> str:
+        return os.path.join(self.directory, f'{self.name}.json')
+
+    def key(self, digest=None) -> dict:
+        stat = os.stat(self.source)
+        return {
+            'version': version,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': digest or file_hash(self.source),
+        }
+
+    def fresh(self) -> bool:
+        try:
+            with open(self.key_path) as file:
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        stat = os.stat(self.source)
+        if cached.get('version') != version or cached['size'] != stat.st_size:
+            return False
+        if cached['mtime'] == stat.st_mtime_ns:
+            return True
+
+        digest = file_hash(self.source)
+        if cached['hash'] != digest:
+            return False
+
+        with open(self.key_path, 'w') as file:
+            json.dump(self.key(digest), file)
+        return True
+
+    def read(self, frame: str, columns=None):
+        return pyarrow.feather.read_table(self.path(frame),
+                                          columns=columns).to_pandas()
+
+    def write(self, **frames):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.key_path):
+            os.remove(self.key_path)
+
+        for frame, df in frames.items():
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            pyarrow.feather.write_feather(table, self.path(frame))
+
+        # The key is written last, an interrupted write leaves no valid cache
+        with open(self.key_path, 'w') as file:
+            json.dump(self.key(), file)
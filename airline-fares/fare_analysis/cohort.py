@@ -0,0 +1,51 @@
+def filter_by_airline(segments, airlines):
+    # Mask of itineraries where every segment is operated by one of airlines
+    return segments['airline'].isin(airlines) \
+        .groupby(segments['itinerary']).all()
+
+
+def filter_by_class(segments, travel_class):
+    # Mask of itineraries where every segment is in the travel class
+    return (segments['cabin'] == travel_class) \
+        .groupby(segments['itinerary']).all()
+
+
+class CohortIndex:
+    # Boolean masks of cohorts of itineraries (travel class, group of airlines)
+    # and columns derived from the whole frame, both are only computed once,
+    # analyses select rows of the frame using the masks instead of copying
+    # and filtering the frame again
+
+    def __init__(self, df, segments):
+        self.df = df
+        self.segments = segments
+        self.cache = dict()
+
+    def cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def class_mask(self, travel_class):
+        def compute():
+            mask = filter_by_class(self.segments, travel_class)
+            return mask.reindex(self.df.index, fill_value=False)
+        return self.cached(('class', travel_class), compute)
+
+    def airline_mask(self, airlines):
+        def compute():
+            mask = filter_by_airline(self.segments, airlines)
+            return mask.reindex(self.df.index, fill_value=False)
+        return self.cached(('airlines', frozenset(airlines)), compute)
+
+    def mask(self, travel_class, airlines=None):
+        def compute():
+            mask = self.class_mask(travel_class)
+            if airlines:
+                mask = mask & self.airline_mask(airlines)
+            return mask
+        key = ('cohort', travel_class, frozenset(airlines or ()))
+        return self.cached(key, compute)
+
+    def column(self, name, compute):
+        return self.cached(('column', name), lambda: compute(self.df))
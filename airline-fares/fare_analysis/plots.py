@@ -0,0 +1,156 @@
+from dataclasses import dataclass, replace
+from multiprocessing import Pool
+
+import numpy
+import pandas
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+from matplotlib.colors import LogNorm  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+
+@dataclass
+class PlotJob:
+    # Everything needed to render one figure, jobs are sent to the workers
+    # so the data is only the (small) selection that is plotted
+    kind: str
+    file: str
+    x: object
+    y: object
+    title: str
+    xlabel: str = None
+    ylabel: str = None
+    stats: list[dict] = None
+
+
+def boxplot(job: PlotJob):
+    if len(job.y.dropna()):
+        sns.boxplot(y=job.y, x=job.x).set(title=job.title)
+    else:
+        plt.title(job.title)
+
+
+def bxp(job: PlotJob):
+    # An empty cohort has no groups, its figure only keeps the title and
+    # labels
+    if job.stats:
+        plt.gca().bxp(job.stats)
+    plt.title(job.title)
+
+
+def scatter(job: PlotJob):
+    plt.scatter(y=job.y, x=job.x)
+    plt.title(job.title)
+
+
+def density(job: PlotJob):
+    # An empty cohort has no counts to scale the colors by, its figure only
+    # keeps the title and labels
+    if job.stats['counts'].max(initial=0) > 0:
+        counts = numpy.ma.masked_equal(job.stats['counts'], 0)
+        plt.pcolormesh(job.stats['xedges'], job.stats['yedges'], counts.T,
+                       norm=LogNorm(), cmap='viridis')
+        plt.colorbar(label='Count')
+
+    x, y = job.stats['sample']
+    if len(x):
+        plt.scatter(x=x, y=y, s=2, c='tab:red', alpha=0.5)
+
+    plt.title(job.title)
+
+
+renderers = {
+    'boxplot': boxplot,
+    'bxp': bxp,
+    'density': density,
+    'scatter': scatter,
+}
+
+
+def boxplot_stats(x, y, whis=1.5, max_fliers=100) -> list[dict]:
+    # Statistics drawn by a boxplot of y grouped by x, computed the same way
+    # as matplotlib does, keeping at most max_fliers outliers of each group
+    frame = pandas.DataFrame({'x': x.values, 'y': y.values}).dropna()
+    if frame.empty:
+        return []
+    grouped = frame.groupby('x')['y']
+
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    low = (quartiles[0.25] - whis * iqr).reindex(frame['x']).values
+    high = (quartiles[0.75] + whis * iqr).reindex(frame['x']).values
+
+    inside = (frame['y'] >= low) & (frame['y'] <= high)
+    whiskers = frame[inside].groupby('x')['y'].agg(['min', 'max'])
+    fliers = frame[~inside].groupby('x').head(max_fliers) \
+        .groupby('x')['y'].agg(list)
+
+    return [{
+        'label': group,
+        'q1': quartiles.at[group, 0.25],
+        'med': quartiles.at[group, 0.5],
+        'q3': quartiles.at[group, 0.75],
+        'whislo': whiskers.at[group, 'min'],
+        'whishi': whiskers.at[group, 'max'],
+        'fliers': fliers.get(group, []),
+    } for group in quartiles.index]
+
+
+def summarize(job: PlotJob) -> PlotJob:
+    # Boxplot job drawn from per-group statistics instead of all of its rows
+    if job.kind != 'boxplot':
+        return job
+    return replace(job, kind='bxp', x=None, y=None,
+                   xlabel=job.xlabel or job.x.name,
+                   ylabel=job.ylabel or job.y.name,
+                   stats=boxplot_stats(job.x, job.y))
+
+
+def densify(job: PlotJob, bins=200, overlay=0, seed=None) -> PlotJob:
+    # Scatter job drawn as a 2D histogram of its points, optionally overlaid
+    # with a uniform sample of overlay points, thus the rendering time only
+    # depends on the number of bins
+    if job.kind != 'scatter':
+        return job
+
+    x = numpy.asarray(job.x, dtype=float)
+    y = numpy.asarray(job.y, dtype=float)
+    valid = ~(numpy.isnan(x) | numpy.isnan(y))
+    x, y = x[valid], y[valid]
+
+    counts, xedges, yedges = numpy.histogram2d(x, y, bins=bins)
+
+    rng = numpy.random.default_rng(seed)
+    sample = rng.choice(len(x), min(overlay, len(x)), replace=False)
+
+    return replace(job, kind='density', x=None, y=None, stats={
+        'counts': counts,
+        'xedges': xedges,
+        'yedges': yedges,
+        'sample': (x[sample], y[sample]),
+    })
+
+
+def render(job: PlotJob) -> str:
+    figure = plt.figure()
+    renderers[job.kind](job)
+
+    if job.xlabel:
+        plt.xlabel(job.xlabel)
+    if job.ylabel:
+        plt.ylabel(job.ylabel)
+
+    plt.savefig(job.file)
+    plt.close(figure)
+
+    return job.file
+
+
+def render_all(jobs: list[PlotJob], workers: int = None) -> list[str]:
+    if workers == 1:
+        return [render(job) for job in jobs]
+
+    with Pool(workers) as pool:
+        return pool.map(render, jobs, chunksize=1)
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+
+import pandas
+
+
+@dataclass
+class Table:
+    columns: list[str]
+    rows: list[tuple]
+
+    def markdown(self) -> str:
+        lines = [
+            f'|{"|".join(self.columns)}|',
+            f'|{"|".join("-" * len(column) for column in self.columns)}|',
+        ]
+        lines += [f'|{"|".join(map(str, row))}|' for row in self.rows]
+        return '\n'.join(lines)
+
+
+def count(column):
+    # Occurrences of each value in order of first appearance, unobserved
+    # categories are left out
+    return column.groupby(column, sort=False, observed=True).size()
+
+
+def add_counts(counts, other):
+    # Values new to counts are appended, ties are still broken by first
+    # appearance when taking the top of merged counts
+    index = counts.index.append(other.index[~other.index.isin(counts.index)])
+    return counts.reindex(index, fill_value=0) \
+        + other.reindex(index, fill_value=0)
+
+
+@dataclass
+class TrafficReport:
+    # Airline, airport and route counters of a frame of itineraries and its
+    # segments, reports of disjoint frames are combined with merge
+    together: dict[str, set[str]] = field(default_factory=dict)
+    appearances: pandas.Series = None
+    visits: pandas.Series = None
+    destinations: pandas.Series = None
+    routes: pandas.Series = None
+
+    @staticmethod
+    def of(df, segments):
+        airlines = segments[['itinerary', 'airline']].drop_duplicates()
+        pairs = airlines.merge(airlines, on='itinerary',
+                               suffixes=('', 'Other'))
+        pairs = pairs[pairs['airline'] != pairs['airlineOther']]
+        together = {airline: set() for airline in airlines['airline'].unique()}
+        for airline, other in zip(pairs['airline'], pairs['airlineOther']):
+            together[airline].add(other)
+
+        destinations = count(df['destinationAirport'])
+        routes = df.groupby(['segmentsDepartureAirportCode',
+                             'destinationAirport'],
+                            sort=False, observed=True).size()
+
+        return TrafficReport(
+                together=together,
+                appearances=count(segments['airline']),
+                visits=add_counts(count(segments['departure']), destinations),
+                destinations=destinations,
+                routes=routes,
+                )
+
+    def merge(self, other):
+        if self.appearances is None:
+            self.together = {airline: set(others)
+                             for airline, others in other.together.items()}
+            self.appearances = other.appearances
+            self.visits = other.visits
+            self.destinations = other.destinations
+            self.routes = other.routes
+            return
+
+        for airline, others in other.together.items():
+            self.together.setdefault(airline, set()).update(others)
+        self.appearances = add_counts(self.appearances, other.appearances)
+        self.visits = add_counts(self.visits, other.visits)
+        self.destinations = add_counts(self.destinations, other.destinations)
+        self.routes = add_counts(self.routes, other.routes)
+
+    def tables(self, limit, airport_data) -> list[Table]:
+        together = Table(['airline', 'shares flights with'], [
+            (airline, ', '.join(others))
+            for airline, others in self.together.items()])
+
+        appearances = Table(['airline', 'appearances in multisegment trips'],
+                            list(self.appearances.items()))
+
+        visits = self.visits.nlargest(limit)
+        visits = Table(['Airport', 'Airport name', 'Number of visits'], list(
+            zip(visits.index, airport_data.names(visits.index), visits)))
+
+        destinations = self.destinations.nlargest(limit)
+        destinations = Table(['Airport', 'Airport name', 'Number of trips'],
+                             list(zip(destinations.index,
+                                      airport_data.names(destinations.index),
+                                      destinations)))
+
+        routes = Table(['Route', 'Number of trips'], [
+            (f'{dep}-{dest}', trips)
+            for (dep, dest), trips in self.routes.nlargest(limit).items()])
+
+        return [together, appearances, visits, destinations, routes]
@@ -0,0 +1,482 @@
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+import numpy
+import pandas
+
+import analysis
+from aircraft import body_type, map_unique
+from cohort import CohortIndex
+from plots import PlotJob, render_all
+from report import TrafficReport
+
+
+columns = {
+    'searchDate': 'str',
+    'flightDate': 'str',
+    'destinationAirport': 'str',
+    'isNonStop': 'bool',
+    'totalFare': 'float64',
+    'seatsRemaining': 'int32',
+    'totalTravelDistance': 'float64',
+    'segmentsDepartureTimeEpochSeconds': 'str',
+    'segmentsArrivalAirportCode': 'str',
+    'segmentsDepartureAirportCode': 'str',
+    'segmentsAirlineCode': 'str',
+    'segmentsEquipmentDescription': 'str',
+    'segmentsCabinCode': 'str',
+}
+
+traditional = ['DL', 'AA', 'UA']
+lcc = ['B6', 'NK', 'SY', 'F9']
+
+cohorts = [
+    ('coach', None), ('business', None),
+    ('coach', traditional), ('business', traditional),
+    ('coach', lcc), ('business', lcc),
+]
+
+
+@dataclass
+class Correlation:
+    # Pearson correlation from running means and co-moments, accumulators of
+    # disjoint chunks are combined with the pairwise update of Chan et al.
+    count: int = 0
+    mean_x: float = 0.0
+    mean_y: float = 0.0
+    m2_x: float = 0.0
+    m2_y: float = 0.0
+    c_xy: float = 0.0
+
+    @staticmethod
+    def of(x, y):
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        if not len(x):
+            return Correlation()
+        dx = x - x.mean()
+        dy = y - y.mean()
+        return Correlation(len(x), x.mean(), y.mean(),
+                           dx @ dx, dy @ dy, dx @ dy)
+
+    def update(self, x, y):
+        self.merge(Correlation.of(x, y))
+
+    def merge(self, other):
+        count = self.count + other.count
+        if not other.count:
+            return
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.count * other.count / count
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.m2_y += other.m2_y + dy * dy * weight
+        self.c_xy += other.c_xy + dx * dy * weight
+        self.mean_x += dx * other.count / count
+        self.mean_y += dy * other.count / count
+        self.count = count
+
+    def value(self):
+        if self.count < 2 or not self.m2_x or not self.m2_y:
+            return math.nan
+        return self.c_xy / math.sqrt(self.m2_x * self.m2_y)
+
+
+@dataclass
+class QuantileSketch:
+    # Histogram over logarithmically sized buckets, quantiles are estimated
+    # with relative error of at most accuracy, sketches are merged by adding
+    # bucket counts
+    accuracy: float = 0.01
+    buckets: Counter = field(default_factory=Counter)
+    zeros: int = 0
+    count: int = 0
+    low: float = math.inf
+    high: float = -math.inf
+
+    @property
+    def gamma(self):
+        return (1 + self.accuracy) / (1 - self.accuracy)
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype=float)
+        values = values[~numpy.isnan(values)]
+        if not len(values):
+            return
+
+        self.count += len(values)
+        self.low = min(self.low, values.min())
+        self.high = max(self.high, values.max())
+
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+
+        keys = numpy.ceil(numpy.log(positive) / math.log(self.gamma))
+        keys, counts = numpy.unique(keys.astype(int), return_counts=True)
+        self.buckets.update(dict(zip(keys.tolist(), counts.tolist())))
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+
+    def values(self):
+        # Representative value of each bucket with its count, ascending
+        if self.zeros:
+            yield 0.0, self.zeros
+        gamma = self.gamma
+        for key in sorted(self.buckets):
+            value = 2 * gamma ** key / (gamma + 1)
+            yield min(max(value, self.low), self.high), self.buckets[key]
+
+    def quantile(self, q):
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.values():
+            seen += count
+            if seen > rank:
+                return value
+        return self.high
+
+    def boxplot_stats(self, whis=1.5):
+        q1, med, q3 = (self.quantile(q) for q in (0.25, 0.5, 0.75))
+        iqr = q3 - q1
+
+        low, high = q1 - whis * iqr, q3 + whis * iqr
+        values = [value for value, _ in self.values()]
+        inside = [value for value in values if low <= value <= high]
+
+        # Outliers are approximated by the representatives of their buckets
+        return {
+            'n': self.count,
+            'q1': q1,
+            'med': med,
+            'q3': q3,
+            'whislo': min(inside, default=q1),
+            'whishi': max(inside, default=q3),
+            'fliers': [value for value in values if not low <= value <= high],
+        }
+
+
+@dataclass
+class DensityGrid:
+    # Counts of points in the cells of a grid of fixed cell size, the grid
+    # grows with the extent of the data, which needs not be known in advance
+    width_x: float
+    width_y: float
+    cells: Counter = field(default_factory=Counter)
+
+    def update(self, x, y):
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        valid = ~(numpy.isnan(x) | numpy.isnan(y))
+
+        cells = numpy.stack([numpy.floor(x[valid] / self.width_x),
+                             numpy.floor(y[valid] / self.width_y)], axis=1)
+        cells, counts = numpy.unique(cells.astype(int), axis=0,
+                                     return_counts=True)
+        self.cells.update(dict(zip(map(tuple, cells.tolist()),
+                                   counts.tolist())))
+
+    def merge(self, other):
+        self.cells.update(other.cells)
+
+    def histogram(self):
+        cells = numpy.array(list(self.cells), dtype=int).reshape(-1, 2)
+        low = cells.min(axis=0, initial=0)
+        high = cells.max(axis=0, initial=0)
+
+        counts = numpy.zeros(high - low + 1)
+        counts[cells[:, 0] - low[0], cells[:, 1] - low[1]] = \
+            list(self.cells.values())
+
+        return {
+            'counts': counts,
+            'xedges': numpy.arange(low[0], high[0] + 2) * self.width_x,
+            'yedges': numpy.arange(low[1], high[1] + 2) * self.width_y,
+        }
+
+
+rng = numpy.random.default_rng()
+
+
+@dataclass
+class Reservoir:
+    # Uniform sample of at most size points, every point gets a random key
+    # and the points with the smallest keys are kept, thus samples of
+    # disjoint chunks merge into a uniform sample of their union
+    size: int
+    keys: numpy.ndarray = field(default_factory=lambda: numpy.empty(0))
+    x: numpy.ndarray = field(default_factory=lambda: numpy.empty(0))
+    y: numpy.ndarray = field(default_factory=lambda: numpy.empty(0))
+
+    def update(self, x, y):
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        self.merge(Reservoir(self.size, rng.random(len(x)), x, y))
+
+    def merge(self, other):
+        keys = numpy.concatenate([self.keys, other.keys])
+        x = numpy.concatenate([self.x, other.x])
+        y = numpy.concatenate([self.y, other.y])
+
+        if len(keys) > self.size:
+            kept = numpy.argpartition(keys, self.size)[:self.size]
+            keys, x, y = keys[kept], x[kept], y[kept]
+
+        self.keys, self.x, self.y = keys, x, y
+
+
+# Cell of the price per mile density, (miles, dollars per mile)
+price_per_mile_cell = (20, 0.02)
+
+
+def update_groups(sketches, keys, values):
+    for key, group in values.groupby(keys.values):
+        sketches[key].update(group.values)
+
+
+def grouped_sketches():
+    return defaultdict(QuantileSketch)
+
+
+@dataclass
+class FareAggregates:
+    # Reports of analysis.process accumulated chunk by chunk, the state only
+    # depends on the number of distinct airports, airlines and flights
+    traffic: TrafficReport = field(default_factory=TrafficReport)
+    scraped: int = 0
+    correlations: defaultdict = field(
+            default_factory=lambda: defaultdict(Correlation))
+    price_per_mile: defaultdict = field(
+            default_factory=lambda: defaultdict(Correlation))
+    boxplots: defaultdict = field(
+            default_factory=lambda: defaultdict(grouped_sketches))
+    flights: pandas.DataFrame = None
+    new_flights: list = field(default_factory=list)
+    new_flight_rows: int = 0
+    overlay: int = 0
+    densities: defaultdict = field(default_factory=lambda: defaultdict(
+            lambda: DensityGrid(*price_per_mile_cell)))
+    samples: defaultdict = None
+
+    def __post_init__(self):
+        if self.samples is None:
+            self.samples = defaultdict(lambda: Reservoir(self.overlay))
+
+    def update(self, df):
+        segments = analysis.preprocess_df(df)
+        index = CohortIndex(df, segments)
+
+        self.traffic.merge(TrafficReport.of(df, segments))
+        self.scraped += int((df['dateDiff'] > 1).sum())
+
+        priced = index.column('priced', analysis.priced)
+        dow = index.column('dow', analysis.day_of_week)
+        seats = index.column('emptySeatsBucket', analysis.empty_seats_bucket)
+        non_stop = index.column('pricedNonStop', analysis.priced_non_stop)
+        ppm = index.column('ppm', analysis.price_per_mile_column)
+
+        for travel_class, airlines in cohorts:
+            key = (travel_class, tuple(airlines or ()))
+            mask = index.mask(travel_class, airlines) & priced
+            self.correlations[key].update(df['totalFare'][mask],
+                                          365 - df['dateDiff'][mask])
+
+            if not airlines:
+                continue
+
+            fare = df['totalFare'][mask]
+            update_groups(self.boxplots[('buckets', *key)],
+                          df['dateDiffBucket'][mask], fare)
+            update_groups(self.boxplots[('dow', *key)], dow[mask], fare)
+            update_groups(self.boxplots[('seatsRemaining', *key)],
+                          seats[mask], fare)
+
+            mask = index.mask(travel_class, airlines) & non_stop
+            distance = df['totalTravelDistance'][mask]
+            self.price_per_mile[key].update(ppm[mask], distance)
+            self.densities[key].update(distance, ppm[mask])
+            if self.overlay:
+                self.samples[key].update(distance, ppm[mask])
+
+        carriers = analysis.carrier_types(index)
+        for travel_class in ('coach', 'business'):
+            mask = index.mask(travel_class) & priced & (carriers != 'ignore')
+            update_groups(self.boxplots[('offers_by_date_diff', travel_class)],
+                          carriers[mask], df['dateDiff'][mask])
+
+        mask = index.mask('business', traditional) & non_stop
+        filtered = df[mask]
+        buckets = analysis.distance_bucket(filtered)
+        body = map_unique(filtered['segmentsEquipmentDescription'],
+                          body_type)
+        for kind in ('widebody', 'narrowbody'):
+            update_groups(self.boxplots[(kind,)], buckets[body == kind],
+                          filtered['totalFare'][body == kind])
+
+        self.add_flights(analysis.extract_flights(segments))
+
+    def merge(self, other):
+        self.traffic.merge(other.traffic)
+        self.scraped += other.scraped
+        for key, corr in other.correlations.items():
+            self.correlations[key].merge(corr)
+        for key, corr in other.price_per_mile.items():
+            self.price_per_mile[key].merge(corr)
+        for key, grid in other.densities.items():
+            self.densities[key].merge(grid)
+        for key, sample in other.samples.items():
+            self.samples[key].merge(sample)
+        for key, groups in other.boxplots.items():
+            for group, sketch in groups.items():
+                self.boxplots[key][group].merge(sketch)
+        self.add_flights(other.distinct_flights())
+
+    def add_flights(self, flights):
+        # New flights are only deduplicated against the known ones once they
+        # outnumber them, a merge costs at most twice the rows added since
+        # the previous one, so the total cost is linear in the rows added
+        if flights is None:
+            return
+        self.new_flights.append(flights)
+        self.new_flight_rows += len(flights)
+        if self.flights is None or self.new_flight_rows >= len(self.flights):
+            self.merge_flights()
+
+    def merge_flights(self):
+        if not self.new_flights:
+            return
+        if self.flights is not None:
+            self.new_flights.insert(0, self.flights)
+        self.flights = pandas.concat(self.new_flights) \
+            .drop_duplicates(ignore_index=True)
+        self.new_flights = []
+        self.new_flight_rows = 0
+
+    def distinct_flights(self):
+        self.merge_flights()
+        return self.flights
+
+
+def print_boxplot_stats(name, groups):
+    print(f'|{name}|n|q1|median|q3|whislo|whishi|')
+    print('|---|---|---|---|---|---|---|')
+    for group in sorted(groups):
+        stats = groups[group].boxplot_stats()
+        print(f'|{group}|{stats["n"]}|{stats["q1"]:.2f}|{stats["med"]:.2f}|'
+              f'{stats["q3"]:.2f}|{stats["whislo"]:.2f}|'
+              f'{stats["whishi"]:.2f}|')
+
+
+boxplot_labels = {
+    'buckets': ('dateDiffBucket', 'totalFare'),
+    'dow': ('dow', 'totalFare'),
+    'seatsRemaining': ('emptySeatsBucket', 'totalFare'),
+    'offers_by_date_diff': ('carrierType', 'dateDiff'),
+    'widebody': ('distanceBucket', 'totalFare'),
+    'narrowbody': ('distanceBucket', 'totalFare'),
+}
+
+
+def boxplot_jobs(aggregates):
+    # The boxplots of analysis.process drawn from the quantile sketches
+    jobs = []
+
+    for (name, *cohort), groups in aggregates.boxplots.items():
+        if len(cohort) == 2:
+            travel_class, airlines = cohort
+            file = f'plots/{name}_{travel_class}_{"_".join(airlines)}.png'
+            title = f'{travel_class} ({", ".join(airlines)})'
+        elif cohort:
+            file = f'plots/{name}_{cohort[0]}.png'
+            title = cohort[0]
+        else:
+            file = f'plots/{name}.png'
+            title = name.capitalize()
+
+        xlabel, ylabel = boxplot_labels[name]
+        stats = [dict(groups[group].boxplot_stats(), label=group)
+                 for group in sorted(groups)]
+
+        jobs.append(PlotJob(kind='bxp', file=file, x=None, y=None,
+                            title=title, xlabel=xlabel, ylabel=ylabel,
+                            stats=stats))
+
+    return jobs
+
+
+def density_jobs(aggregates):
+    # The price per mile scatter plots of analysis.process drawn as densities
+    jobs = []
+
+    for (travel_class, airlines), grid in aggregates.densities.items():
+        sample = aggregates.samples[(travel_class, airlines)]
+        stats = dict(grid.histogram(), sample=(sample.x, sample.y))
+        name = f'{travel_class}_{"_".join(airlines)}'
+
+        jobs.append(PlotJob(kind='density',
+                            file=f'plots/price_per_mile_{name}.png',
+                            x=None, y=None,
+                            title=f'{travel_class} ({", ".join(airlines)})',
+                            xlabel='Travel Distance',
+                            ylabel='Price Per Mile',
+                            stats=stats))
+
+    return jobs
+
+
+def report(aggregates, limit, airport_data):
+    for table in aggregates.traffic.tables(limit, airport_data):
+        print(table.markdown())
+
+    for (travel_class, airlines), corr in aggregates.correlations.items():
+        res_str = f'Correlation for travel class {travel_class}'
+        if airlines:
+            res_str += f' and airlines {list(airlines)}'
+        res_str += f': {corr.value()}'
+        print(res_str)
+
+    print('#deals scraped more than one day before day of flight:',
+          aggregates.scraped)
+
+    for key, groups in aggregates.boxplots.items():
+        name, *cohort = key
+        if len(cohort) == 2:
+            travel_class, airlines = cohort
+            print(f'{name}: {travel_class} ({", ".join(airlines)})')
+        elif cohort:
+            print(f'{name}: {cohort[0]}')
+        else:
+            print(f'{name}:')
+        print_boxplot_stats('group', groups)
+
+    analysis.aircraft_stats(aggregates.distinct_flights())
+
+    for (travel_class, airlines), corr in aggregates.price_per_mile.items():
+        print('Correlation between travel distance and price per mile',
+              f'for class {travel_class} and airlines {list(airlines)}:',
+              corr.value())
+
+
+def process(path: str, chunk_size: int, workers: int = None,
+            overlay: int = 0):
+    print('Loading airport data...')
+    airports = analysis.load_airports('data/airport-codes_csv.csv')
+
+    aggregates = FareAggregates(overlay=overlay)
+
+    chunks = analysis.iter_df(path, chunk_size, list(columns), columns)
+    for i, chunk in enumerate(chunks):
+        print(f'Processing chunk {i}...')
+        aggregates.update(chunk)
+
+    report(aggregates, 10, airports)
+
+    print('Rendering plots...')
+    render_all(boxplot_jobs(aggregates) + density_jobs(aggregates), workers)
+
+    return aggregates
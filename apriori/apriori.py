@@ -1,155 +1,857 @@
-from typing import Any
+import heapq
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+
+from writers import open_writer
+
+
+def iter_combinations(begin: int, end: int, elems: int) -> Iterator[list[int]]:
+    if elems <= 0:
+        return
+
+    # Combinations are generated lazily in lexicographic order, end param of
+    # this function is inclusive
+    for combination in itertools.combinations(range(begin, end+1), elems):
+        yield list(combination)
 
 
 def gen_combinations(begin: int, end: int, elems: int) -> list[list[int]]:
+    return list(iter_combinations(begin, end, elems))
 
-    all_combinations = []
 
+def count_combinations(begin: int, end: int, elems: int) -> int:
     if elems <= 0:
-        return all_combinations
+        return 0
+    return math.comb(max(end - begin + 1, 0), elems)
 
-    # Python ranges are exclusive, end param of this function is inclusive,
-    # thus we add +1 combinations of one element (with begin == end) need to
-    # actually contain that one element, begin must not equal end, hence we add
-    # another +1
-    for i in range(begin, end+2-elems):
-        start = [i]
-        combinations = gen_combinations(i+1, end, elems-1)
-        all_combinations += [start + c for c in combinations] \
-            if combinations else [start]
 
-    return all_combinations
+def rank_combination(combination: list[int], begin: int, end: int) -> int:
+    # Position of the combination in the lexicographic order of
+    # gen_combinations(begin, end, len(combination))
+    n, k = end - begin + 1, len(combination)
+    rank = 0
+    prev = -1
 
+    for i, value in enumerate(combination):
+        value -= begin
+        # Skip all combinations which have a smaller value at this position
+        for smaller in range(prev + 1, value):
+            rank += math.comb(n - 1 - smaller, k - 1 - i)
+        prev = value
 
-def get_combinations(lst: list[Any], elems: int, offset: int = 0) -> list[list[Any]]:
+    return rank
 
-    all_combinations = []
 
-    if elems <= 0:
-        return all_combinations
+def unrank_combination(rank: int, begin: int, end: int, elems: int) -> list[int]:
+    n = end - begin + 1
+    if not 0 <= rank < count_combinations(begin, end, elems):
+        raise IndexError('Combination rank out of range')
+
+    combination = []
+    value = 0
 
-    for i in range(offset, len(lst)+1-elems):
-        start = [lst[i]]
-        combinations = get_combinations(lst, elems-1, i+1)
-        all_combinations += [start + c for c in combinations] if combinations else [start]
+    for i in range(elems):
+        while True:
+            following = math.comb(n - 1 - value, elems - 1 - i)
+            if rank < following:
+                break
+            rank -= following
+            value += 1
+        combination.append(begin + value)
+        value += 1
 
-    return all_combinations
+    return combination
 
 
-def load_ds(file: str) -> list[set[int]]:
-    with open(file) as f:
-        lines = f.readlines()
-    return [{int(record) for record in line.split(' ')} for line in lines]
+def iter_list_combinations(lst: list[Any], elems: int, offset: int = 0) -> Iterator[list[Any]]:
+    if elems <= 0:
+        return
 
+    for combination in itertools.combinations(lst[offset:], elems):
+        yield list(combination)
 
-def create_support_table(ds: list[set[int]], min_supp: float) -> dict[int, int]:
-    supports = dict()
 
-    for record in ds:
+def get_combinations(lst: list[Any], elems: int, offset: int = 0) -> list[list[Any]]:
+    return list(iter_list_combinations(lst, elems, offset))
+
+
+def iter_ds(file: str, begin: int = 0, end: Optional[int] = None) -> Iterator[set[int]]:
+    # begin and end are byte offsets, which allows reading only a part of
+    # a file, e.g. a batch of transactions appended to it
+    with open(file, 'rb') as f:
+        f.seek(begin)
+        position = begin
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            if line.strip():
+                yield {int(record) for record in line.split()}
+
+
+# Vertical layout of a dataset, maps each item to a bitset of IDs of the
+# transactions which contain the item (bit i is set iff transaction i contains
+# the item), support of an itemset is then a popcount of an AND of its bitsets
+@dataclass
+class VerticalDs:
+    tidsets: dict[int, int]
+    size: int
+
+    def tidset(self, itemset: set[int]) -> int:
+        items = iter(itemset)
+        first = next(items, None)
+        # Empty itemset is contained in every transaction
+        if first is None:
+            return (1 << self.size) - 1
+
+        tids = self.tidsets.get(first, 0)
+        for item in items:
+            tids &= self.tidsets.get(item, 0)
+        return tids
+
+    def support_count(self, itemset: set[int]) -> int:
+        return self.tidset(itemset).bit_count()
+
+
+def _to_bitset(tids: list[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for tid in tids:
+        bits[tid >> 3] |= 1 << (tid & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def is_frequent(count: int, size: int, min_supp: float) -> bool:
+    return size > 0 and count / size >= min_supp
+
+
+def min_support_count(size: int, min_supp: float) -> int:
+    # Smallest absolute count which satisfies the relative threshold, computed
+    # through is_frequent to avoid any disagreement caused by rounding
+    count = max(math.ceil(min_supp * size), 1)
+    while count > 1 and is_frequent(count - 1, size, min_supp):
+        count -= 1
+    while count <= size and not is_frequent(count, size, min_supp):
+        count += 1
+    return count
+
+
+# Compact dataset in CSR layout, items of transaction i are
+# indices[indptr[i]:indptr[i+1]]. Items are remapped to dense IDs sorted by
+# descending frequency, items[d] is the original item with dense ID d
+@dataclass
+class TransactionDb:
+    indptr: np.ndarray
+    indices: np.ndarray
+    items: np.ndarray
+    lookup: dict[int, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.lookup = {item: dense for dense, item in enumerate(self.items.tolist())}
+
+    @staticmethod
+    def from_records(records: Iterable[set[int]]) -> 'TransactionDb':
+        raw = array('q')
+        # Offsets may exceed int32 range for large datasets, item IDs won't
+        indptr = array('q', [0])
+        for record in records:
+            raw.extend(record)
+            indptr.append(len(raw))
+
+        raw = np.frombuffer(raw, dtype=np.int64)
+        values, inverse, counts = np.unique(raw, return_inverse=True,
+                                            return_counts=True)
+        order = np.lexsort((values, -counts))
+        dense = np.empty_like(order)
+        dense[order] = np.arange(len(order))
+
+        return TransactionDb(indptr=np.frombuffer(indptr, dtype=np.int64),
+                             indices=dense[inverse].astype(np.int32),
+                             items=values[order])
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def size(self) -> int:
+        return len(self)
+
+    def __getitem__(self, key: slice) -> 'TransactionDb':
+        start, stop, _ = key.indices(len(self))
+        begin, end = self.indptr[start], self.indptr[max(start, stop)]
+        return TransactionDb(indptr=self.indptr[start:max(start, stop)+1] - begin,
+                             indices=self.indices[begin:end],
+                             items=self.items)
+
+    def __iter__(self) -> Iterator[set[int]]:
+        for i in range(len(self)):
+            dense = self.indices[self.indptr[i]:self.indptr[i+1]]
+            yield set(self.items[dense].tolist())
+
+    def item_counts(self) -> dict[int, int]:
+        counts = np.bincount(self.indices, minlength=len(self.items))
+        return {item: count for item, count
+                in zip(self.items.tolist(), counts.tolist()) if count}
+
+    def dense_ids(self, itemset: Iterable[int]) -> Optional[np.ndarray]:
+        try:
+            return np.array([self.lookup[item] for item in itemset],
+                            dtype=np.int32)
+        except KeyError:
+            return None
+
+    def contains(self, itemset: Iterable[int]) -> np.ndarray:
+        itemset = list(itemset)
+        dense = self.dense_ids(itemset)
+        if dense is None:
+            return np.zeros(len(self), dtype=bool)
+
+        # Number of the itemset's items in each transaction, computed from
+        # a prefix sum over the matching entries
+        matches = np.concatenate(([0], np.cumsum(np.isin(self.indices, dense))))
+        per_record = matches[self.indptr[1:]] - matches[self.indptr[:-1]]
+        return per_record == len(itemset)
+
+    def support_count(self, itemset: Iterable[int]) -> int:
+        return int(self.contains(itemset).sum())
+
+    def vertical(self, min_supp: float = 0.0) -> VerticalDs:
+        counts = np.bincount(self.indices, minlength=len(self.items))
+        rows = np.repeat(np.arange(len(self), dtype=np.int64),
+                         np.diff(self.indptr))
+        by_item = rows[np.argsort(self.indices, kind='stable')]
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        tidsets = dict()
+        for dense, item in enumerate(self.items.tolist()):
+            if not is_frequent(int(counts[dense]), len(self), min_supp):
+                continue
+            mask = np.zeros(len(self), dtype=bool)
+            mask[by_item[bounds[dense]:bounds[dense+1]]] = True
+            bits = np.packbits(mask, bitorder='little').tobytes()
+            tidsets[item] = int.from_bytes(bits, 'little')
+
+        return VerticalDs(tidsets=tidsets, size=len(self))
+
+
+def load_ds(file: str, compact: bool = False) -> list[set[int]] | TransactionDb:
+    if compact:
+        return TransactionDb.from_records(iter_ds(file))
+    return list(iter_ds(file))
+
+
+def build_vertical(ds: list[set[int]] | TransactionDb, min_supp: float = 0.0) -> VerticalDs:
+    if isinstance(ds, TransactionDb):
+        return ds.vertical(min_supp)
+
+    tids = dict()
+
+    for tid, record in enumerate(ds):
         for value in record:
-            supports[value] = supports.get(value, 0) + 1
+            tids.setdefault(value, []).append(tid)
 
-    return {value: count/len(ds) for value, count in supports.items() if count/len(ds) >= min_supp}
+    # Only frequent items can appear in frequent itemsets, there is no point in
+    # allocating bitsets for the rest
+    tidsets = {value: _to_bitset(t, len(ds)) for value, t in tids.items()
+               if is_frequent(len(t), len(ds), min_supp)}
 
+    return VerticalDs(tidsets=tidsets, size=len(ds))
 
-def get_init_fis(ds: list[set[int]], min_supp: float) -> dict[int, int]:
+
+def as_counter(ds: list[set[int]] | VerticalDs | TransactionDb) -> VerticalDs | TransactionDb:
+    # Both the vertical layout and the CSR store count supports directly, plain
+    # lists of transactions are converted to the vertical layout
+    if isinstance(ds, (VerticalDs, TransactionDb)):
+        return ds
+    return build_vertical(ds)
+
+
+def create_support_table(ds: list[set[int]] | VerticalDs | TransactionDb,
+                         min_supp: float) -> dict[int, int]:
+    if isinstance(ds, TransactionDb):
+        supports = ds.item_counts()
+        size = len(ds)
+    elif isinstance(ds, VerticalDs):
+        supports = {value: tids.bit_count() for value, tids in ds.tidsets.items()}
+        size = ds.size
+    else:
+        supports = dict()
+        for record in ds:
+            for value in record:
+                supports[value] = supports.get(value, 0) + 1
+        size = len(ds)
+
+    return {value: count/size for value, count in supports.items()
+            if is_frequent(count, size, min_supp)}
+
+
+def get_init_fis(ds: list[set[int]] | VerticalDs | TransactionDb, min_supp: float) -> list[tuple[int, ...]]:
     supp_table = create_support_table(ds, min_supp)
-    return [{val} for val in supp_table]
+    return [(val,) for val in sorted(supp_table)]
 
 
-def get_candidates(ds: list[set[int]]) -> list[set[int]]:
-    sets = []
-    for i in range(len(ds) - 1):
-        for j in range(i+1, len(ds)):
-            fst, snd = ds[i], ds[j]
-            diff = fst.symmetric_difference(snd)
-            if len(diff) == 2:
-                sets.append(fst.union(diff))
-    return sets
+def get_candidates(fis: list[tuple[int, ...]]) -> list[tuple[int, ...]]:
+    # Itemsets are sorted tuples, two k-itemsets are only joined if they share
+    # the first k-1 items, which generates every candidate exactly once
+    frequent = set(fis)
+    by_prefix = dict()
+    for itemset in sorted(fis):
+        by_prefix.setdefault(itemset[:-1], []).append(itemset[-1])
 
+    candidates = []
+    for prefix, last in by_prefix.items():
+        for i in range(len(last) - 1):
+            for j in range(i+1, len(last)):
+                candidate = prefix + (last[i], last[j])
+                # Downward closure, every k-subset of a frequent itemset must
+                # be frequent, subsets without one of the last two items are
+                # the joined itemsets themselves
+                if all(candidate[:k] + candidate[k+1:] in frequent
+                       for k in range(len(candidate) - 2)):
+                    candidates.append(candidate)
 
-def filter_by_support(candidates: list[set[int]], ds: list[set[int]], supp: float) -> list[set[int]]:
+    return candidates
 
-    supp_table = dict()
-    # Unique candidates
-    candidates = [set(c) for c in {tuple(c) for c in candidates}]
 
-    for c in candidates:
-        for rec in ds:
-            if rec.issuperset(c):
-                as_tuple = tuple(c)
-                supp_table[as_tuple] = supp_table.get(as_tuple, 0) + 1
+def filter_by_support(candidates: list[tuple[int, ...]],
+                      ds: list[set[int]] | VerticalDs | TransactionDb,
+                      supp: float) -> dict[tuple[int, ...], int]:
 
-    st = {k: c/len(ds) for k, c in supp_table.items()}
+    counter = as_counter(ds)
+    counts = ((c, counter.support_count(c)) for c in candidates)
 
-    return [set(s) for s, count in supp_table.items() if count/len(ds) > supp]
+    return {c: count for c, count in counts
+            if is_frequent(count, counter.size, supp)}
 
 
-def find_fis(ds: list[set[int]], prev_fis: list[set[int]], supp: float) -> list[set[int]]:
+def find_fis(ds: VerticalDs, prev_fis: list[tuple[int, ...]],
+             supp: float) -> dict[tuple[int, ...], int]:
     if not prev_fis:
-        return []
+        return dict()
 
     candidates = filter_by_support(get_candidates(prev_fis), ds, supp)
 
-    rec_candidates = find_fis(ds, candidates, supp)
+    rec_candidates = find_fis(ds, list(candidates), supp)
+
+    return candidates | rec_candidates
+
+
+def find_all_fis(ds: list[set[int]] | VerticalDs | TransactionDb, supp: float) -> dict[frozenset[int], int]:
+    vertical = ds if isinstance(ds, VerticalDs) else build_vertical(ds, supp)
+    init_fis = filter_by_support(get_init_fis(vertical, supp), vertical, supp)
+    rest = find_fis(vertical, list(init_fis), supp)
+
+    # Supports of all frequent itemsets are kept for rule generation, every
+    # subset of a frequent itemset is frequent, thus confidence of any rule
+    # derived from a frequent itemset is just a lookup
+    return {frozenset(itemset): count
+            for itemset, count in (init_fis | rest).items()}
+
+
+@dataclass(eq=False)
+class FpNode:
+    item: Optional[int]
+    count: int = 0
+    parent: Optional['FpNode'] = None
+    children: dict[int, 'FpNode'] = field(default_factory=dict)
 
-    return candidates + rec_candidates
 
+def count_items(transactions: Iterable[tuple[list[int], int]]) -> dict[int, int]:
+    counts = dict()
 
-def find_all_fis(ds: list[set[int]], supp: float) -> list[set[int]]:
-    init_fis = get_init_fis(ds, supp)
-    rest = find_fis(ds, init_fis, supp)
-    return init_fis + rest
+    for items, weight in transactions:
+        for item in items:
+            counts[item] = counts.get(item, 0) + weight
 
+    return counts
 
-def get_rule_confidence(l: set[int], r: set[int], ds: list[set[int]]) -> float:
-    l_conf = 0
-    union_conf = 0
-    union = l | r
 
-    for rule in ds:
-        l_conf += rule.issuperset(l)
-        union_conf += rule.issuperset(union)
+def build_tree(transactions: Iterable[tuple[list[int], int]], order: dict[int, int],
+               frequent: dict[int, int]) -> dict[int, list[FpNode]]:
 
-    l_conf /= len(ds)
-    union_conf /= len(ds)
+    root = FpNode(item=None)
+    header = {item: [] for item in frequent}
 
-    return union_conf / l_conf
+    for items, weight in transactions:
+        # Items are inserted in a fixed global order (most frequent first) so
+        # that transactions with common frequent items share a prefix
+        path = sorted((i for i in items if i in frequent), key=order.get)
 
+        node = root
+        for item in path:
+            child = node.children.get(item)
+            if child is None:
+                child = FpNode(item=item, parent=node)
+                node.children[item] = child
+                header[item].append(child)
+            child.count += weight
+            node = child
 
-def gen_rules_for_set(fis: set[int], ds: list[set[int]], conf: float) -> set[tuple, tuple, float]:
-    as_list = list(fis)
-    rules = set()
+    return header
 
-    for elems in range(1, len(as_list)):
-        subsets = get_combinations(as_list, elems) 
-        for subset in subsets:
-            as_set = set(subset)
-            l, r = as_set, fis - as_set
-            rule_conf = get_rule_confidence(l, r, ds)
+
+def prefix_paths(nodes: list[FpNode]) -> list[tuple[list[int], int]]:
+    paths = []
+
+    for node in nodes:
+        path = []
+        parent = node.parent
+        while parent.item is not None:
+            path.append(parent.item)
+            parent = parent.parent
+        if path:
+            paths.append((path, node.count))
+
+    return paths
+
+
+def mine_tree(header: dict[int, list[FpNode]], counts: dict[int, int],
+              order: dict[int, int], suffix: frozenset[int], min_count: int,
+              fis: dict[frozenset[int], int]) -> None:
+
+    for item, nodes in header.items():
+        itemset = suffix | {item}
+        fis[itemset] = counts[item]
+
+        # Conditional pattern base of the item, an FP-tree is built out of it
+        # and mined recursively
+        paths = prefix_paths(nodes)
+        cond_counts = {i: c for i, c in count_items(paths).items()
+                       if c >= min_count}
+
+        if cond_counts:
+            cond_header = build_tree(paths, order, cond_counts)
+            mine_tree(cond_header, cond_counts, order, itemset, min_count, fis)
+
+
+def fp_growth(ds: list[set[int]] | TransactionDb, supp: float) -> dict[frozenset[int], int]:
+    min_count = min_support_count(len(ds), supp)
+
+    # First pass over the dataset, frequent items are ordered by descending
+    # frequency
+    counts = count_items((record, 1) for record in ds)
+    frequent = {item: count for item, count in counts.items()
+                if count >= min_count}
+    ranked = sorted(frequent, key=lambda item: (-frequent[item], item))
+    order = {item: rank for rank, item in enumerate(ranked)}
+
+    # Second pass over the dataset builds the FP-tree
+    header = build_tree(((record, 1) for record in ds), order, frequent)
+
+    fis = dict()
+    mine_tree(header, frequent, order, frozenset(), min_count, fis)
+
+    return dict(sorted(fis.items(), key=lambda x: len(x[0])))
+
+
+def count_candidates(candidates: list[tuple[int, ...]],
+                     ds: Iterable[set[int]]) -> dict[tuple[int, ...], int]:
+    counts = {c: 0 for c in candidates}
+    if not candidates:
+        return counts
+
+    items = set().union(*candidates)
+    k = len(candidates[0])
+
+    for record in ds:
+        record = sorted(items.intersection(record))
+        if len(record) < k:
+            continue
+        # Either look up every k-subset of the transaction, or test every
+        # candidate against the transaction, whichever is cheaper
+        if math.comb(len(record), k) <= len(candidates):
+            for subset in itertools.combinations(record, k):
+                if subset in counts:
+                    counts[subset] += 1
+        else:
+            as_set = set(record)
+            for c in candidates:
+                if as_set.issuperset(c):
+                    counts[c] += 1
+
+    return counts
+
+
+def find_all_fis_streaming(file: str, supp: float) -> dict[frozenset[int], int]:
+    # Only the candidates of a single level and their counts are kept in memory,
+    # the dataset is read from the file once per level
+    size = 0
+    item_counts = dict()
+    for record in iter_ds(file):
+        size += 1
+        for value in record:
+            item_counts[value] = item_counts.get(value, 0) + 1
+
+    level = {(value,): count for value, count in sorted(item_counts.items())
+             if is_frequent(count, size, supp)}
+    fis = dict()
+
+    while level:
+        fis |= level
+        candidates = get_candidates(list(level))
+        counts = count_candidates(candidates, iter_ds(file))
+        level = {c: count for c, count in counts.items()
+                 if is_frequent(count, size, supp)}
+
+    return {frozenset(itemset): count for itemset, count in fis.items()}
+
+
+def update_fis(file: str, supp: float, fis: dict[frozenset[int], int], size: int,
+               begin: int, end: int) -> tuple[dict[frozenset[int], int], int]:
+    # FUP, itemsets frequent in the old part of the dataset only need their
+    # counts updated with the new batch. Any other itemset was infrequent in
+    # the old part and can only become frequent if it is frequent in the
+    # batch, only those are counted in the old part again
+    batch = TransactionDb.from_records(iter_ds(file, begin, end))
+    if not len(batch):
+        return fis, size
+
+    vertical = build_vertical(batch)
+    total = size + len(batch)
+
+    items = {item for itemset in fis if len(itemset) == 1 for item in itemset}
+    candidates = [(item,) for item in sorted(items | set(vertical.tidsets))]
+    updated = dict()
+
+    while candidates:
+        level = dict()
+        promoted = []
+
+        for c in candidates:
+            delta = vertical.support_count(c)
+            if frozenset(c) in fis:
+                level[c] = fis[frozenset(c)] + delta
+            elif is_frequent(delta, len(batch), supp):
+                promoted.append((c, delta))
+
+        if promoted:
+            old_counts = count_candidates([c for c, _ in promoted],
+                                          iter_ds(file, 0, begin))
+            for c, delta in promoted:
+                level[c] = old_counts[c] + delta
+
+        level = {c: count for c, count in level.items()
+                 if is_frequent(count, total, supp)}
+        updated |= level
+        candidates = get_candidates(sorted(level))
+
+    return {frozenset(itemset): count for itemset, count in updated.items()}, total
+
+
+def find_all_fis_incremental(file: str, supp: float, state: str) -> dict[frozenset[int], int]:
+    # State of the previous run is stored in a json file, supports of all
+    # frequent itemsets, number of transactions and how far the file was read
+    end = os.path.getsize(file)
+    previous = None
+    if os.path.exists(state):
+        with open(state) as f:
+            previous = json.load(f)
+
+    if previous and previous['min_supp'] == supp and previous['offset'] <= end:
+        fis = {frozenset(itemset): count for itemset, count in previous['supports']}
+        fis, size = update_fis(file, supp, fis, previous['transactions'],
+                               previous['offset'], end)
+    else:
+        ds = TransactionDb.from_records(iter_ds(file, 0, end))
+        fis = find_all_fis(ds, supp)
+        size = len(ds)
+
+    with open(state, 'w') as f:
+        json.dump({
+            'min_supp': supp,
+            'transactions': size,
+            'offset': end,
+            'supports': [[sorted(itemset), count] for itemset, count in fis.items()],
+        }, f)
+
+    return fis
+
+
+def mine_shard(args: tuple[TransactionDb, float, str]) -> list[frozenset[int]]:
+    shard, supp, algorithm = args
+    if algorithm == 'fpgrowth':
+        return list(fp_growth(shard, supp))
+    return list(find_all_fis(shard, supp))
+
+
+def count_shard(args: tuple[TransactionDb, list[frozenset[int]]]) -> list[int]:
+    shard, candidates = args
+    vertical = build_vertical(shard)
+    return [vertical.support_count(c) for c in candidates]
+
+
+def find_all_fis_parallel(ds: list[set[int]] | TransactionDb, supp: float, workers: int,
+                          algorithm: str = 'apriori') -> dict[frozenset[int], int]:
+    # SON algorithm, an itemset frequent in the whole dataset must be frequent
+    # in at least one of its partitions. Partitions are mined independently,
+    # union of their frequent itemsets is then counted over all partitions
+    # in a second pass
+    step = max(math.ceil(len(ds) / workers), 1)
+    shards = [ds[i:i+step] for i in range(0, len(ds), step)]
+
+    with multiprocessing.Pool(workers) as pool:
+        local_fis = pool.map(mine_shard, [(s, supp, algorithm) for s in shards])
+        candidates = sorted(set().union(*local_fis),
+                            key=lambda c: (len(c), sorted(c)))
+        counts = pool.map(count_shard, [(s, candidates) for s in shards])
+
+    totals = (sum(shard_counts) for shard_counts in zip(*counts))
+
+    return {c: count for c, count in zip(candidates, totals)
+            if is_frequent(count, len(ds), supp)}
+
+
+# Supports of closed itemsets, support of any other frequent itemset is the
+# support of its smallest closed superset, i.e. the largest support among its
+# closed supersets
+class ClosedSupports(dict):
+
+    def __init__(self, closed: dict[frozenset[int], int]):
+        super().__init__(closed)
+        self.by_item = dict()
+        for itemset in closed:
+            for item in itemset:
+                self.by_item.setdefault(item, []).append(itemset)
+
+    def __missing__(self, itemset: frozenset[int]) -> int:
+        if not itemset:
+            raise KeyError(itemset)
+
+        rarest = min(itemset, key=lambda i: len(self.by_item.get(i, [])))
+        supports = [self[c] for c in self.by_item.get(rarest, [])
+                    if itemset <= c]
+
+        if not supports:
+            raise KeyError(itemset)
+        return max(supports)
+
+
+def charm_extend(nodes: list[Optional[tuple[frozenset[int], int]]], min_count: int,
+                 closed: dict[frozenset[int], int],
+                 by_tids: dict[int, list[frozenset[int]]]) -> None:
+
+    for i in range(len(nodes)):
+        if nodes[i] is None:
+            continue
+        itemset, tids = nodes[i]
+        children = []
+
+        for j in range(i+1, len(nodes)):
+            if nodes[j] is None:
+                continue
+            other, other_tids = nodes[j]
+            joined = tids & other_tids
+            if joined.bit_count() < min_count:
+                continue
+
+            # Items which occur in every transaction containing the itemset
+            # belong to its closure, items whose transactions are a superset
+            # of the itemset's never need to be explored on their own
+            if joined == tids:
+                itemset |= other
+                if joined == other_tids:
+                    nodes[j] = None
+            else:
+                if joined == other_tids:
+                    nodes[j] = None
+                children.append((other, joined))
+
+        if children:
+            children.sort(key=lambda c: c[1].bit_count())
+            charm_extend([(itemset | other, t) for other, t in children],
+                         min_count, closed, by_tids)
+
+        # An itemset is closed unless an already found closed itemset with
+        # the same transactions contains it
+        same_tids = by_tids.setdefault(tids, [])
+        if not any(itemset <= c for c in same_tids):
+            same_tids.append(itemset)
+            closed[itemset] = tids.bit_count()
+
+
+def charm(ds: list[set[int]] | VerticalDs | TransactionDb, supp: float) -> dict[frozenset[int], int]:
+    vertical = ds if isinstance(ds, VerticalDs) else build_vertical(ds, supp)
+    min_count = min_support_count(vertical.size, supp)
+
+    nodes = [(frozenset([item]), tids) for item, tids in vertical.tidsets.items()
+             if tids.bit_count() >= min_count]
+    nodes.sort(key=lambda n: n[1].bit_count())
+
+    closed = dict()
+    charm_extend(nodes, min_count, closed, dict())
+
+    return dict(sorted(closed.items(), key=lambda x: len(x[0])))
+
+
+def closed_itemsets(fis: dict[frozenset[int], int]) -> dict[frozenset[int], int]:
+    # An itemset is not closed if it has an immediate superset with the same
+    # support, every immediate superset of a frequent itemset which has the
+    # same support is frequent as well
+    not_closed = set()
+
+    for itemset, count in fis.items():
+        for item in itemset:
+            subset = itemset - {item}
+            if fis.get(subset) == count:
+                not_closed.add(subset)
+
+    return {itemset: count for itemset, count in fis.items()
+            if itemset not in not_closed}
+
+
+def maximal_itemsets(closed: dict[frozenset[int], int]) -> dict[frozenset[int], int]:
+    # Every maximal itemset is closed, a closed itemset is maximal if no
+    # larger closed itemset contains it. Maximal itemsets found so far are
+    # numbered and each item keeps the bitset of the maximal itemsets it is
+    # in, a superset of an itemset is in the bitsets of all of its items
+    maximal = dict()
+    by_item = dict()
+
+    for itemset in sorted(closed, key=len, reverse=True):
+        supersets = (1 << len(maximal)) - 1
+        for item in itemset:
+            supersets &= by_item.get(item, 0)
+            if not supersets:
+                break
+
+        # Itemsets of equal length are distinct, only larger ones are left
+        if supersets:
+            continue
+
+        bit = 1 << len(maximal)
+        for item in itemset:
+            by_item[item] = by_item.get(item, 0) | bit
+        maximal[itemset] = closed[itemset]
+
+    return dict(sorted(maximal.items(), key=lambda x: len(x[0])))
+
+
+def get_rule_confidence(l: set[int], r: set[int],
+                        ds: dict[frozenset[int], int] | list[set[int]] | VerticalDs |
+                        TransactionDb) -> float:
+    if isinstance(ds, dict):
+        return ds[frozenset(l | r)] / ds[frozenset(l)]
+
+    counter = as_counter(ds)
+    return counter.support_count(l | r) / counter.support_count(l)
+
+
+def iter_rules_for_set(fis: frozenset[int],
+                       supports: dict[frozenset[int], int],
+                       conf: float) -> Iterator[tuple[tuple, tuple, float]]:
+    # Consequents grow level-wise, confidence only decreases when items move
+    # from antecedent to consequent, thus larger consequents are only built
+    # from consequents whose rules passed the threshold
+    consequents = [(item,) for item in sorted(fis)]
+
+    while consequents and len(consequents[0]) < len(fis):
+        passed = []
+        for r in consequents:
+            l = fis.difference(r)
+            rule_conf = get_rule_confidence(l, frozenset(r), supports)
             if rule_conf >= conf:
-                rules.add((tuple(sorted(l)), tuple(sorted(r)), rule_conf))
+                passed.append(r)
+                yield tuple(sorted(l)), r, rule_conf
+        consequents = get_candidates(passed)
+
 
-    return rules
+def gen_rules_for_set(fis: frozenset[int], supports: dict[frozenset[int], int],
+                      conf: float) -> set[tuple, tuple, float]:
+    return set(iter_rules_for_set(fis, supports, conf))
 
 
-def gen_rules(fis: list[set[int]], ds: list[set[int]], conf: float) -> set[tuple, tuple, float]:
-    fis = [s for s in fis if len(s) > 1]
-    rules = set()
+def rule_score(rule: tuple[tuple, tuple, float], supports: dict[frozenset[int], int],
+               metric: str) -> float:
+    l, r, rule_conf = rule
+    if metric == 'lift':
+        # Lift is confidence divided by relative support of the consequent,
+        # number of transactions is the same for every rule and does not
+        # change the ranking
+        return rule_conf / supports[frozenset(r)]
+    return rule_conf
 
+
+def iter_rules(fis: dict[frozenset[int], int], conf: float,
+               supports: Optional[dict[frozenset[int], int]] = None) -> Iterator[tuple[tuple, tuple, float]]:
+    supports = fis if supports is None else supports
     for itemset in fis:
-        rules |= gen_rules_for_set(itemset, ds, conf)
+        if len(itemset) > 1:
+            yield from iter_rules_for_set(itemset, supports, conf)
 
-    return rules
 
+def gen_rules(fis: dict[frozenset[int], int], conf: float,
+              supports: Optional[dict[frozenset[int], int]] = None,
+              top_k: Optional[int] = None,
+              metric: str = 'confidence') -> set[tuple, tuple, float] | list[tuple, tuple, float]:
+    supports = fis if supports is None else supports
+    rules = iter_rules(fis, conf, supports)
 
-def find_patterns(file: str, supp: float, conf: float):
-    ds = load_ds(file)
-    fis = find_all_fis(ds, supp)
-    for f in fis:
-        print(f'fis: {f}')
-    rules = gen_rules(fis, ds, conf)
-    for rule in rules:
-        l, r, conf = rule
-        print(f'{l} => {r} ({conf})')
+    if top_k is None:
+        return set(rules)
+    if top_k < 1:
+        raise ValueError('top_k must be at least 1')
 
+    # Only the k best rules are kept in a min-heap, rules are ordered by the
+    # score, ties are broken by the rule itself to keep the result stable
+    best = []
+    for rule in rules:
+        entry = (rule_score(rule, supports, metric), rule)
+        if len(best) < top_k:
+            heapq.heappush(best, entry)
+        elif entry > best[0]:
+            heapq.heapreplace(best, entry)
+
+    return [rule for _, rule in sorted(best, reverse=True)]
+
+
+def find_patterns(file: str, supp: float, conf: float, algorithm: str = 'apriori',
+                  workers: int = 1, streaming: bool = False, output: str = 'all',
+                  top_k: Optional[int] = None, metric: str = 'confidence',
+                  state: Optional[str] = None, output_format: str = 'text',
+                  output_file: Optional[str] = None):
+    mined_closed = False
+
+    if streaming:
+        fis = find_all_fis_streaming(file, supp)
+    elif state:
+        fis = find_all_fis_incremental(file, supp, state)
+    elif workers > 1:
+        fis = find_all_fis_parallel(load_ds(file, compact=True), supp, workers,
+                                    algorithm)
+    elif output != 'all':
+        fis = charm(load_ds(file, compact=True), supp)
+        mined_closed = True
+    elif algorithm == 'fpgrowth':
+        fis = fp_growth(load_ds(file, compact=True), supp)
+    else:
+        fis = find_all_fis(load_ds(file, compact=True), supp)
+
+    supports = fis
+    if output != 'all':
+        # Only CHARM mines closed itemsets directly, other miners produce all
+        # frequent itemsets
+        if not mined_closed:
+            fis = closed_itemsets(fis)
+        supports = ClosedSupports(fis)
+    if output == 'maximal':
+        fis = maximal_itemsets(fis)
+
+    # Rules are written as they are generated unless only the best ones are
+    # requested
+    if top_k is None:
+        rules = iter_rules(fis, conf, supports)
+    else:
+        rules = gen_rules(fis, conf, supports, top_k, metric)
+
+    with open_writer(output_format, output_file) as writer:
+        for itemset, count in fis.items():
+            writer.write_itemset(itemset, count)
+        for l, r, rule_conf in rules:
+            writer.write_rule(l, r, rule_conf)
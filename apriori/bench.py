@@ -0,0 +1,192 @@
+import json
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import click
+import numpy as np
+
+from apriori import (TransactionDb, load_ds, build_vertical, create_support_table,
+                     get_init_fis, get_candidates, filter_by_support, gen_rules,
+                     find_all_fis, fp_growth, charm, find_all_fis_streaming)
+
+
+max_stale_draws = 1000
+
+
+def gen_quest_ds(transactions: int, avg_len: float, items: int, patterns: int,
+                 avg_pattern_len: float, seed: int = 0) -> list[list[int]]:
+    # Synthetic baskets in the style of the IBM Quest generator, transactions
+    # are made of potentially frequent patterns which partially overlap with
+    # one another, patterns are picked with exponentially distributed weights
+    # and some of their items are randomly dropped
+    rng = np.random.default_rng(seed)
+
+    pool = []
+    prev = np.array([], dtype=np.int64)
+    for _ in range(patterns):
+        size = min(max(int(rng.poisson(avg_pattern_len)), 1), items)
+        shared = min(int(size * min(rng.exponential(0.5), 1.0)), len(prev))
+        pattern = set(rng.choice(prev, shared, replace=False).tolist()) if shared else set()
+        while len(pattern) < size:
+            pattern.add(int(rng.integers(items)))
+        prev = np.array(sorted(pattern))
+        pool.append(prev)
+
+    weights = rng.exponential(1.0, patterns)
+    weights /= weights.sum()
+    corruption = np.clip(rng.normal(0.5, 0.1, patterns), 0.0, 1.0)
+
+    # Transactions cannot be larger than the items the patterns are made of
+    distinct = len(set().union(*(pattern.tolist() for pattern in pool)))
+
+    ds = []
+    for _ in range(transactions):
+        size = min(max(int(rng.poisson(avg_len)), 1), distinct)
+        record = set()
+        stale = 0
+        # Corrupted patterns may add nothing, give up after many such draws
+        while len(record) < size and stale < max_stale_draws:
+            i = rng.choice(patterns, p=weights)
+            pattern = pool[i]
+            kept = pattern[rng.random(len(pattern)) >= corruption[i]]
+            # Pattern which does not fit is added half of the time
+            if record and len(record) + len(kept) > size and rng.random() < 0.5:
+                break
+            grown = len(record)
+            record.update(kept.tolist())
+            stale = stale + 1 if len(record) == grown else 0
+        ds.append(sorted(record))
+
+    return ds
+
+
+def write_ds(ds: list[list[int]], file: str) -> None:
+    with open(file, 'w') as f:
+        for record in ds:
+            f.write(' '.join(map(str, record)))
+            f.write('\n')
+
+
+def measure(fn: Callable[[], Any]) -> tuple[Any, dict[str, float]]:
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return result, {'seconds': elapsed, 'peak_bytes': peak}
+
+
+def bench_apriori(db: TransactionDb, supp: float, conf: float) -> dict[str, Any]:
+    # Same steps as find_all_fis, every phase of every level is measured
+    # on its own
+    report = {'levels': []}
+
+    vertical, report['build_vertical'] = measure(lambda: build_vertical(db, supp))
+    _, report['create_support_table'] = measure(
+        lambda: create_support_table(vertical, supp))
+
+    init = get_init_fis(vertical, supp)
+    level, stats = measure(lambda: filter_by_support(init, vertical, supp))
+    report['levels'].append({
+        'k': 1,
+        'candidates': len(init),
+        'frequent': len(level),
+        'filter_by_support': stats,
+    })
+
+    fis = dict(level)
+    while level:
+        candidates, gen_stats = measure(lambda: get_candidates(list(level)))
+        if not candidates:
+            break
+        level, filter_stats = measure(
+            lambda: filter_by_support(candidates, vertical, supp))
+        fis |= level
+        report['levels'].append({
+            'k': len(candidates[0]),
+            'candidates': len(candidates),
+            'frequent': len(level),
+            'pruning_ratio': 1 - len(level) / len(candidates),
+            'get_candidates': gen_stats,
+            'filter_by_support': filter_stats,
+        })
+
+    fis = {frozenset(itemset): count for itemset, count in fis.items()}
+    rules, report['gen_rules'] = measure(lambda: gen_rules(fis, conf))
+    report['itemsets'] = len(fis)
+    report['rules'] = len(rules)
+
+    return report
+
+
+def bench_strategies(file: str, db: TransactionDb, supp: float) -> dict[str, Any]:
+    strategies = {
+        'apriori': lambda: find_all_fis(db, supp),
+        'fpgrowth': lambda: fp_growth(db, supp),
+        'charm': lambda: charm(db, supp),
+        'streaming': lambda: find_all_fis_streaming(file, supp),
+    }
+
+    report = dict()
+    for name, fn in strategies.items():
+        fis, stats = measure(fn)
+        report[name] = stats | {'itemsets': len(fis)}
+
+    return report
+
+
+@click.command()
+@click.option('--output', help='Path to the generated dataset')
+@click.option('--transactions', default=10000, help='Number of transactions')
+@click.option('--avg-len', default=10.0, help='Average transaction length')
+@click.option('--items', default=1000, help='Number of distinct items')
+@click.option('--patterns', default=200, help='Number of potential patterns')
+@click.option('--avg-pattern-len', default=4.0, help='Average pattern length')
+@click.option('--seed', default=0, help='Random seed')
+def generate(output: str, transactions: int, avg_len: float, items: int,
+             patterns: int, avg_pattern_len: float, seed: int) -> None:
+    ds = gen_quest_ds(transactions, avg_len, items, patterns, avg_pattern_len,
+                      seed)
+    write_ds(ds, output)
+
+
+@click.command()
+@click.option('--file', help='Path to dataset')
+@click.option('--min-sup', default=0.01, help='Minimum support')
+@click.option('--min-conf', default=0.5, help='Minimum confidence')
+@click.option('--output', default=None, help='Path to the json report')
+def run(file: str, min_sup: float, min_conf: float, output: str) -> None:
+    tracemalloc.start()
+
+    db, load_stats = measure(lambda: load_ds(file, compact=True))
+    report = {
+        'file': file,
+        'transactions': len(db),
+        'min_sup': min_sup,
+        'min_conf': min_conf,
+        'load_ds': load_stats,
+        'apriori': bench_apriori(db, min_sup, min_conf),
+        'strategies': bench_strategies(file, db, min_sup),
+    }
+
+    tracemalloc.stop()
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+@click.group('Apriori benchmarks')
+def main() -> None:
+    pass
+
+
+main.add_command(generate)
+main.add_command(run)
+
+
+if __name__ == '__main__':
+    main()
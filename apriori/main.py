@@ -1,25 +1,84 @@
 import click
 
-from apriori import gen_combinations as gen_combinations_int
+from apriori import iter_combinations, count_combinations, unrank_combination
 from apriori import find_patterns as find_patterns_int
 
 
 @click.command()
 @click.option('--begin', help='Start of interval')
 @click.option('--end', help='End of interval')
-@click.option('--elements', help='Minimum confidence')
-def gen_combinations(begin: int, end: int, elements: int) -> None:
-    combinations = gen_combinations_int(int(begin), int(end), int(elements))
-    for c in combinations:
-        print(c)
+@click.option('--elements', help='Number of elements in a combination')
+@click.option('--count', is_flag=True, default=False,
+              help='Only print the number of combinations')
+@click.option('--rank', type=int, default=None,
+              help='Only print the combination at this lexicographic position')
+def gen_combinations(begin: int, end: int, elements: int, count: bool,
+                     rank: int) -> None:
+    begin, end, elements = int(begin), int(end), int(elements)
+
+    if count:
+        print(count_combinations(begin, end, elements))
+    elif rank is not None:
+        try:
+            print(unrank_combination(rank, begin, end, elements))
+        except IndexError as e:
+            raise click.BadParameter(str(e), param_hint='--rank')
+    else:
+        for c in iter_combinations(begin, end, elements):
+            print(c)
 
 
 @click.command()
 @click.option('--file', help='Path to dataset')
 @click.option('--min-sup', default=0.25, help='Minimum support')
 @click.option('--min-conf', default=0.5, help='Minimum confidence')
-def find_patterns(file: str, min_sup: float, min_conf: float) -> None:
-    find_patterns_int(file, float(min_sup), float(min_conf))
+@click.option('--algorithm', default='apriori',
+              type=click.Choice(['apriori', 'fpgrowth']),
+              help='Frequent itemset mining algorithm')
+@click.option('--workers', default=1, type=int,
+              help='Number of processes used for mining')
+@click.option('--streaming', is_flag=True, default=False,
+              help='Read the dataset from disk on each level of apriori '
+                   'instead of loading it into memory')
+@click.option('--output', default='all',
+              type=click.Choice(['all', 'closed', 'maximal']),
+              help='Which frequent itemsets to output, closed and maximal '
+                   'itemsets are mined with CHARM')
+@click.option('--top-k', type=click.IntRange(min=1), default=None,
+              help='Only output the k best rules')
+@click.option('--rank-by', default='confidence',
+              type=click.Choice(['confidence', 'lift']),
+              help='Metric used to select the best rules')
+@click.option('--state', default=None,
+              help='State file of incremental mining, only transactions '
+                   'appended since the previous run are mined')
+@click.option('--output-format', default='text',
+              type=click.Choice(['text', 'jsonl', 'csv', 'npz']),
+              help='Format of mined itemsets and rules')
+@click.option('--output-file', default=None,
+              help='File to write patterns to, stdout if not set')
+def find_patterns(file: str, min_sup: float, min_conf: float,
+                  algorithm: str, workers: int, streaming: bool,
+                  output: str, top_k: int, rank_by: str, state: str,
+                  output_format: str, output_file: str) -> None:
+    if output_format == 'npz' and not output_file:
+        raise click.UsageError('npz output requires --output-file')
+    # Streaming and incremental mining only run apriori in a single process
+    if streaming and state:
+        raise click.UsageError('--streaming cannot be used with --state')
+    mode = '--streaming' if streaming else '--state' if state else None
+    if mode:
+        if workers != 1:
+            raise click.UsageError(f'{mode} cannot be used with --workers')
+        if algorithm != 'apriori':
+            raise click.UsageError(f'{mode} cannot be used with '
+                                   f'--algorithm {algorithm}')
+    if output != 'all' and algorithm != 'apriori':
+        raise click.UsageError(f'{output} itemsets are mined with CHARM, '
+                               f'--algorithm {algorithm} cannot be used')
+    find_patterns_int(file, float(min_sup), float(min_conf), algorithm,
+                      workers, streaming, output, top_k, rank_by, state,
+                      output_format, output_file)
 
 
 @click.group('Apriori')
@@ -0,0 +1,138 @@
+import csv
+import json
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from typing import Optional, TextIO
+
+import numpy as np
+
+
+# Writers output mined patterns as they are produced, files are written
+# through a large buffer, nothing is kept in memory apart from the npz writer,
+# which stores patterns in compact arrays until it is closed
+
+BUFFER_SIZE = 1 << 20
+
+
+class PatternWriter(ABC):
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.file = self.open(path)
+
+    def open(self, path: Optional[str]) -> Optional[TextIO]:
+        if path is None:
+            return sys.stdout
+        return open(path, 'w', buffering=BUFFER_SIZE, newline='')
+
+    @abstractmethod
+    def write_itemset(self, itemset: frozenset[int], support: int) -> None:
+        pass
+
+    @abstractmethod
+    def write_rule(self, l: tuple, r: tuple, conf: float) -> None:
+        pass
+
+    def close(self) -> None:
+        if self.file is sys.stdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+    def __enter__(self) -> 'PatternWriter':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class TextWriter(PatternWriter):
+
+    def write_itemset(self, itemset: frozenset[int], support: int) -> None:
+        self.file.write(f'fis: {set(itemset)}\n')
+
+    def write_rule(self, l: tuple, r: tuple, conf: float) -> None:
+        self.file.write(f'{l} => {r} ({conf})\n')
+
+
+class JsonlWriter(PatternWriter):
+
+    def write_itemset(self, itemset: frozenset[int], support: int) -> None:
+        self.file.write(json.dumps({'itemset': sorted(itemset),
+                                    'support': support}))
+        self.file.write('\n')
+
+    def write_rule(self, l: tuple, r: tuple, conf: float) -> None:
+        self.file.write(json.dumps({'antecedent': list(l),
+                                    'consequent': list(r),
+                                    'confidence': conf}))
+        self.file.write('\n')
+
+
+class CsvWriter(PatternWriter):
+
+    def __init__(self, path: Optional[str]):
+        super().__init__(path)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['type', 'antecedent', 'consequent', 'support',
+                              'confidence'])
+
+    def write_itemset(self, itemset: frozenset[int], support: int) -> None:
+        items = ' '.join(map(str, sorted(itemset)))
+        self.writer.writerow(['itemset', items, '', support, ''])
+
+    def write_rule(self, l: tuple, r: tuple, conf: float) -> None:
+        self.writer.writerow(['rule', ' '.join(map(str, l)),
+                              ' '.join(map(str, r)), '', conf])
+
+
+class NpzWriter(PatternWriter):
+
+    # Itemsets are offset encoded, items of itemset i are
+    # itemset_items[itemset_offsets[i]:itemset_offsets[i+1]], antecedents and
+    # consequents of rules are stored the same way
+
+    def open(self, path: Optional[str]) -> Optional[TextIO]:
+        if path is None:
+            raise ValueError('npz output requires an output file')
+        self.arrays = {
+            'itemset_offsets': array('q', [0]),
+            'itemset_items': array('q'),
+            'itemset_support': array('q'),
+            'antecedent_offsets': array('q', [0]),
+            'antecedent_items': array('q'),
+            'consequent_offsets': array('q', [0]),
+            'consequent_items': array('q'),
+            'confidence': array('d'),
+        }
+        return None
+
+    def append(self, name: str, items) -> None:
+        self.arrays[f'{name}_items'].extend(items)
+        self.arrays[f'{name}_offsets'].append(len(self.arrays[f'{name}_items']))
+
+    def write_itemset(self, itemset: frozenset[int], support: int) -> None:
+        self.append('itemset', sorted(itemset))
+        self.arrays['itemset_support'].append(support)
+
+    def write_rule(self, l: tuple, r: tuple, conf: float) -> None:
+        self.append('antecedent', l)
+        self.append('consequent', r)
+        self.arrays['confidence'].append(conf)
+
+    def close(self) -> None:
+        np.savez(self.path, **{name: np.frombuffer(values, dtype=values.typecode)
+                               for name, values in self.arrays.items()})
+
+
+writers = {
+    'text': TextWriter,
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'npz': NpzWriter,
+}
+
+
+def open_writer(output_format: str, path: Optional[str] = None) -> PatternWriter:
+    return writers[output_format](path)